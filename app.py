@@ -1,18 +1,34 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import os
 import json
+import time
 import uuid
 from datetime import datetime
+from urllib.parse import urlparse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import threading
 from modules.brand_analyzer import BrandAnalyzer
 from modules.competitor_finder import CompetitorFinder
 from modules.foreplay_client import ForeplayClient
+from modules.ad_patterns import digest_ads
 from modules.reddit_miner import RedditMiner
-from modules.ai_engine import AIEngine
+from modules.ai_engine import AIEngine, AI_MODES
 from modules.coda_publisher import CodaPublisher
 from modules.error_logger import error_logger
+from modules.pipeline import Pipeline, Stage
+from modules.async_runtime import runtime
+from modules.job_store import create_job_store
+from modules.shared_work import SharedWork
+from modules.clients import clients
+from modules.circuit_breaker import breakers
+from modules.deadline import deadline_scope, BRIEF_DEADLINE_SECONDS
+from modules.tokens import usage_scope, TokenUsage
+from modules.stage_memo import memo_scope, MemoReport, stage_memo
+from modules.openai_helper import llm_cache
+from modules.rate_limiter import openai_limiter
+from modules.hedging import hedger
+from modules.model_router import router
+from modules.metrics import metrics, InstrumentedThreadPool, JOBS_IN_FLIGHT, JOBS_TOTAL, JOB_LATENCY
 
 # Log startup info
 print("Starting app with requests-based OpenAI implementation")
@@ -20,9 +36,24 @@ print("Environment: Production on Render")
 
 app = Flask(__name__)
 
-# Store job status in memory (in production, use Redis or database)
-job_status = {}
-executor = ThreadPoolExecutor(max_workers=4)
+# Job status lives in a store shared by all workers (JOB_STORE=sqlite|memory)
+job_store = create_job_store()
+executor = InstrumentedThreadPool('jobs', max_workers=4)
+# Stages of running jobs; separate from `executor` so a job never waits on its own pool
+stage_executor = InstrumentedThreadPool('stages', max_workers=int(os.environ.get('STAGE_WORKERS', 16)))
+# 'threads' runs each job on `executor`; 'async' runs jobs as coroutines on the shared event loop
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'threads')
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 50))
+# Repeat submissions for a domain join its job while running or this long after it finished (0 disables)
+COALESCE_WINDOW_SECONDS = int(os.environ.get('COALESCE_WINDOW_SECONDS', 300))
+# Default AI generation mode ('multi' or 'fused'); requests may pass their own ai_mode
+AI_MODE = os.environ.get('AI_MODE', 'multi')
+# Each progress stream holds a gthread thread for the whole job; keep the rest free for
+# requests and polling. Past the cap, streams get a 503 and the page falls back to polling.
+STREAM_MAX_CONNECTIONS = int(os.environ.get('STREAM_MAX_CONNECTIONS', 16))
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONNECTIONS)
+STREAMS_REJECTED = metrics.counter(
+    'sse_streams_rejected_total', 'Progress streams turned away because every stream slot was taken')
 
 @app.route('/')
 def home():
@@ -35,6 +66,15 @@ def debug():
         'api_status': error_logger.check_api_status(),
         'recent_errors': error_logger.get_errors()[-10:],  # Last 10 errors
         'error_count': len(error_logger.get_errors()),
+        'pipeline_mode': PIPELINE_MODE,
+        'upstream_concurrency': runtime.get_stats(),
+        'shared_clients': clients.get_stats(),
+        'circuit_breakers': breakers.get_stats(),
+        'llm_cache': llm_cache.get_stats(),
+        'ai_stage_memo': stage_memo.cache.get_stats(),
+        'openai_rate_limiter': openai_limiter.get_stats(),
+        'openai_hedging': hedger.get_stats(),
+        'model_routes': router.get_stats(),
         'environment': {
             'OPENAI_API_KEY': 'Set' if os.environ.get('OPENAI_API_KEY') else 'Not set',
             'FOREPLAY_API_KEY': 'Set' if os.environ.get('FOREPLAY_API_KEY') else 'Not set',
@@ -56,95 +96,455 @@ def generate_brief():
         if not brand_url:
             return jsonify({'error': 'URL is required'}), 400
         
-        # Create job ID
-        job_id = str(uuid.uuid4())
-        job_status[job_id] = {
-            'status': 'processing',
-            'progress': 0,
-            'message': 'Initializing...',
-            'result': None,
-            'error': None,
-            'started_at': datetime.now().isoformat()
-        }
+        deadline = _requested_deadline(data)
+        if deadline is None:
+            return jsonify({'error': 'deadline_seconds must be a positive number'}), 400
+        ai_mode = data.get('ai_mode', AI_MODE)
+        if ai_mode not in AI_MODES:
+            return jsonify({'error': f"ai_mode must be one of: {', '.join(AI_MODES)}"}), 400
         
-        # Start processing in background
-        executor.submit(process_brief, job_id, brand_url)
+        job_id, coalesced = start_job(
+            brand_url, idempotency_key=request.headers.get('Idempotency-Key'), deadline_seconds=deadline,
+            ai_mode=ai_mode
+        )
         
-        return jsonify({'job_id': job_id}), 202
+        return jsonify({'job_id': job_id, 'coalesced': coalesced}), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def process_brief(job_id, brand_url):
-    """Process the brief generation in background"""
+@app.route('/api/generate/batch', methods=['POST'])
+def generate_batch():
+    """Generate briefs for several URLs, sharing niche-level work between them"""
     try:
-        # Initialize components
-        brand_analyzer = BrandAnalyzer()
-        competitor_finder = CompetitorFinder()
-        foreplay = ForeplayClient()
-        reddit_miner = RedditMiner()
-        ai_engine = AIEngine()
-        coda_publisher = CodaPublisher()
+        data = request.get_json()
+        urls = data.get('urls')
+        if not isinstance(urls, list):
+            return jsonify({'error': 'urls must be a non-empty list'}), 400
+        urls = [url.strip() for url in urls if isinstance(url, str) and url.strip()]
         
-        # Step 1: Analyze brand (15%)
-        job_status[job_id]['progress'] = 5
-        job_status[job_id]['message'] = 'Analyzing brand website...'
-        brand_data = brand_analyzer.analyze(brand_url)
+        if not urls:
+            return jsonify({'error': 'urls must be a non-empty list'}), 400
+        if len(urls) > BATCH_MAX_URLS:
+            return jsonify({'error': f'At most {BATCH_MAX_URLS} URLs per batch'}), 400
+        deadline = _requested_deadline(data)
+        if deadline is None:
+            return jsonify({'error': 'deadline_seconds must be a positive number'}), 400
+        ai_mode = data.get('ai_mode', AI_MODE)
+        if ai_mode not in AI_MODES:
+            return jsonify({'error': f"ai_mode must be one of: {', '.join(AI_MODES)}"}), 400
         
-        # Step 2: Find competitors (30%)
-        job_status[job_id]['progress'] = 20
-        job_status[job_id]['message'] = 'Finding competitors...'
-        competitors = competitor_finder.find(brand_data)
+        # Plan: one job per distinct brand domain, all sharing one compute-once memo
+        # for Reddit pain points (per niche) and Foreplay searches (per keyword)
+        by_domain = {}
+        for url in urls:
+            by_domain.setdefault(canonical_domain(url), url)
+        unique_urls = list(by_domain.values())
+        shared = SharedWork()
+        batch_id = str(uuid.uuid4())
+        job_store.create(batch_id, {
+            'status': 'processing',
+            'progress': 0,
+            'message': f'Generating {len(unique_urls)} briefs...',
+            'result': None,
+            'error': None,
+            'started_at': datetime.now().isoformat(),
+            'type': 'batch',
+            'jobs': []
+        })
         
-        # Step 3: Get Meta ads (50%)
-        job_status[job_id]['progress'] = 35
-        job_status[job_id]['message'] = 'Analyzing Meta ads...'
-        meta_ads = foreplay.get_top_advertisers(brand_data['keywords'], competitors)
+        jobs = [
+            {'url': url, 'job_id': start_job(
+                url, shared=shared, batch_id=batch_id, deadline_seconds=deadline, ai_mode=ai_mode)[0]}
+            for url in unique_urls
+        ]
+        job_store.update(batch_id, jobs=jobs)
         
-        # Step 4: Mine Reddit (65%)
-        job_status[job_id]['progress'] = 50
-        job_status[job_id]['message'] = 'Mining Reddit for customer problems...'
-        reddit_problems = reddit_miner.mine_problems(brand_data['keywords'], brand_data['niche'])
+        return jsonify({'batch_id': batch_id, 'jobs': jobs}), 202
         
-        # Step 5: AI Analysis (85%)
-        job_status[job_id]['progress'] = 70
-        job_status[job_id]['message'] = 'Generating creative strategy...'
-        brief = ai_engine.generate_brief({
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _requested_deadline(data):
+    """Per-request `deadline_seconds` (default BRIEF_DEADLINE_SECONDS); None if invalid"""
+    value = data.get('deadline_seconds', BRIEF_DEADLINE_SECONDS)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        return None
+    return float(value)
+
+def canonical_domain(url):
+    """Brand identity used for coalescing: lowercase host without scheme, www. or port"""
+    url = url.strip().lower()
+    if '://' not in url:
+        url = 'https://' + url
+    host = urlparse(url).hostname or url
+    return host[4:] if host.startswith('www.') else host
+
+def start_job(brand_url, shared=None, batch_id=None, idempotency_key=None, deadline_seconds=BRIEF_DEADLINE_SECONDS,
+              ai_mode=AI_MODE):
+    """
+    Create the job record and start processing in background
+    Returns (job_id, coalesced). A request with a known Idempotency-Key, or for a
+    domain that is already in flight (or finished within COALESCE_WINDOW_SECONDS),
+    gets the existing job instead of starting a duplicate pipeline. Only jobs run
+    with the same ai_mode and deadline are shared.
+    """
+    job_id = str(uuid.uuid4())
+    domain = canonical_domain(brand_url)
+    job_store.create(job_id, {
+        'status': 'processing',
+        'progress': 0,
+        'message': 'Initializing...',
+        'result': None,
+        'error': None,
+        'started_at': datetime.now().isoformat(),
+        'url': brand_url,
+        'domain': domain,
+        'batch_id': batch_id,
+        'deadline_seconds': deadline_seconds,
+        'ai_mode': ai_mode
+    })
+    
+    # A job run with other settings is a different result, so it never satisfies this request
+    options = f'{ai_mode}:{deadline_seconds:g}'
+    owner = job_id
+    if idempotency_key:
+        owner = job_store.claim_key(f'idempotency:{idempotency_key}:{options}', job_id)
+    if owner == job_id and COALESCE_WINDOW_SECONDS > 0:
+        owner = job_store.claim_key(f'domain:{domain}:{options}', job_id, window=COALESCE_WINDOW_SECONDS)
+    if owner != job_id:
+        job_store.delete(job_id)
+        if idempotency_key:
+            # Our record is gone, so this re-points the key at the job we joined
+            job_store.claim_key(f'idempotency:{idempotency_key}:{options}', owner)
+        print(f"Coalesced request for {domain} onto job {owner}")
+        return owner, True
+    
+    if PIPELINE_MODE == 'async':
+        runtime.submit(process_brief_async(job_id, brand_url, shared, deadline_seconds=deadline_seconds,
+                                           ai_mode=ai_mode))
+    else:
+        executor.submit(process_brief, job_id, brand_url, shared, deadline_seconds=deadline_seconds, ai_mode=ai_mode)
+    
+    return job_id, False
+
+def build_brief_pipeline():
+    """Build the stage graph for one brief; stages start as soon as their inputs exist"""
+    # Clients are shared by every job in the process (see modules/clients.py)
+    brand_analyzer = clients.get(BrandAnalyzer)
+    competitor_finder = clients.get(CompetitorFinder)
+    foreplay = clients.get(ForeplayClient)
+    reddit_miner = clients.get(RedditMiner)
+    ai_engine = clients.get(AIEngine)
+    coda_publisher = clients.get(CodaPublisher)
+
+    def brief_input(brand_data, competitors, meta_ads, reddit_problems, ad_digest):
+        return {
             'brand': brand_data,
             'competitors': competitors,
             'meta_ads': meta_ads,
-            'reddit_problems': reddit_problems
-        })
-        
-        # Step 6: Create Coda doc (100%)
-        job_status[job_id]['progress'] = 90
-        job_status[job_id]['message'] = 'Creating Coda document...'
-        coda_url = coda_publisher.create_doc(brief)
-        
-        # Complete
-        job_status[job_id]['status'] = 'completed'
-        job_status[job_id]['progress'] = 100
-        job_status[job_id]['message'] = 'Brief generated successfully!'
-        job_status[job_id]['result'] = {
-            'coda_url': coda_url,
+            'reddit_problems': reddit_problems,
+            'ad_digest': ad_digest
+        }
+
+    def profile_ads(meta_ads, keyword_ads):
+        # The digest only enriches the trends prompt, so a bad ad must not fail the brief
+        try:
+            return digest_ads(foreplay.collect_ads(keyword_ads, meta_ads))
+        except Exception as e:
+            error_logger.log_error('digest_ads', e)
+            print(f"Ad pattern analysis error: {e}")
+            return None
+
+    def generate_brief(brand_data, competitors, meta_ads, reddit_problems, ad_digest, publish_concepts, ai_mode):
+        return ai_engine.generate_brief(
+            brief_input(brand_data, competitors, meta_ads, reddit_problems, ad_digest),
+            on_concept=publish_concepts, mode=ai_mode)
+
+    def generate_brief_async(brand_data, competitors, meta_ads, reddit_problems, ad_digest, publish_concepts, ai_mode):
+        return ai_engine.generate_brief_async(
+            brief_input(brand_data, competitors, meta_ads, reddit_problems, ad_digest),
+            on_concept=publish_concepts, mode=ai_mode)
+
+    return Pipeline([
+        Stage('brand', brand_analyzer.analyze,
+              async_func=brand_analyzer.analyze_async,
+              inputs=['brand_url'], outputs=['brand_data'],
+              message='Analyzing brand website...', weight=15),
+        Stage('competitors', competitor_finder.find,
+              async_func=competitor_finder.find_async,
+              inputs=['brand_data'], outputs=['competitors'],
+              message='Finding competitors...', weight=15),
+        Stage('keyword_ads', lambda brand_data, shared: foreplay.search_keyword_ads(
+                  brand_data['keywords'], shared=shared),
+              async_func=lambda brand_data, shared: foreplay.search_keyword_ads_async(
+                  brand_data['keywords'], shared=shared),
+              inputs=['brand_data', 'shared'], outputs=['keyword_ads'],
+              message='Searching Meta ads...', weight=10),
+        Stage('meta_ads', lambda brand_data, competitors, keyword_ads: foreplay.get_top_advertisers(
+                  brand_data['keywords'], competitors, keyword_ads=keyword_ads),
+              async_func=lambda brand_data, competitors, keyword_ads: foreplay.get_top_advertisers_async(
+                  brand_data['keywords'], competitors, keyword_ads=keyword_ads),
+              inputs=['brand_data', 'competitors', 'keyword_ads'], outputs=['meta_ads'],
+              message='Analyzing Meta ads...', weight=5),
+        # Local NumPy pass over every fetched ad; takes milliseconds, so it carries no weight
+        Stage('ad_patterns', profile_ads,
+              inputs=['meta_ads', 'keyword_ads'], outputs=['ad_digest'],
+              message='Profiling ad patterns...', weight=0),
+        Stage('reddit', lambda brand_data, shared: reddit_miner.mine_problems(
+                  brand_data['keywords'], brand_data['niche'], shared=shared),
+              async_func=lambda brand_data, shared: reddit_miner.mine_problems_async(
+                  brand_data['keywords'], brand_data['niche'], shared=shared),
+              inputs=['brand_data', 'shared'], outputs=['reddit_problems'],
+              message='Mining Reddit for customer problems...', weight=15),
+        Stage('brief', generate_brief, async_func=generate_brief_async,
+              inputs=['brand_data', 'competitors', 'meta_ads', 'reddit_problems', 'ad_digest',
+                      'publish_concepts', 'ai_mode'],
+              outputs=['brief'],
+              message='Generating creative strategy...', weight=30),
+        Stage('coda', coda_publisher.create_doc,
+              async_func=coda_publisher.create_doc_async,
+              inputs=['brief'], outputs=['coda_url'],
+              message='Creating Coda document...', weight=10),
+    ])
+
+def _progress_reporter(job_id):
+    """Pipeline progress callback that writes into the job's status"""
+    def on_progress(progress, message, stages):
+        job_store.update(job_id, progress=progress, message=message, stages=stages)
+    return on_progress
+
+def _checkpointer(job_id):
+    """Pipeline callback that persists each finished stage's outputs"""
+    def on_stage_done(stage, outputs):
+        job_store.save_checkpoint(job_id, stage, outputs)
+    return on_stage_done
+
+def _concept_publisher(job_id):
+    """Callback that shows ad concepts in the job status while they are still streaming in"""
+    def publish(concepts):
+        job_store.update(job_id, partial_concepts=concepts)
+    return publish
+
+def _initial_context(job_id, brand_url, shared, checkpoints, ai_mode):
+    """Pipeline inputs plus any outputs restored from checkpoints"""
+    context = {
+        'brand_url': brand_url,
+        'shared': shared,
+        'publish_concepts': _concept_publisher(job_id),
+        'ai_mode': ai_mode
+    }
+    for outputs in (checkpoints or {}).values():
+        context.update(outputs)
+    return context
+
+def _complete_job(job_id, context, usage, memo_report):
+    JOBS_TOTAL.inc(status='completed')
+    brand_data = context['brand_data']
+    job_store.update(
+        job_id,
+        status='completed',
+        progress=100,
+        message='Brief generated successfully!',
+        result={
+            'coda_url': context['coda_url'],
             'brand_name': brand_data.get('brand_name', 'Unknown'),
-            'completed_at': datetime.now().isoformat()
+            'completed_at': datetime.now().isoformat(),
+            'token_usage': usage.summary(),
+            'stage_memo': memo_report.summary()
         }
+    )
+
+def _fail_job(job_id, brand_url, e, usage):
+    JOBS_TOTAL.inc(status='failed')
+    error_logger.log_error('process_brief', e, {'job_id': job_id, 'url': brand_url})
+    job_store.update(
+        job_id,
+        status='failed',
+        error=str(e),
+        message=f'Error: {str(e)}',
+        failed_stage=getattr(e, 'stage', None),
+        token_usage=usage.summary()
+    )
+    print(f"Process brief error: {e}")
+
+def process_brief(job_id, brand_url, shared=None, checkpoints=None, deadline_seconds=BRIEF_DEADLINE_SECONDS,
+                  ai_mode=AI_MODE):
+    """
+    Process the brief generation in background, skipping checkpointed stages
+    Upstream calls share a `deadline_seconds` budget; once it runs out, stages
+    fall back to their defaults instead of waiting on slow upstreams.
+    """
+    JOBS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 'failed'
+    usage = TokenUsage()
+    memo_report = MemoReport()
+    try:
+        with deadline_scope(deadline_seconds), usage_scope(usage), memo_scope(memo_report):
+            context = build_brief_pipeline().run(
+                _initial_context(job_id, brand_url, shared, checkpoints, ai_mode),
+                executor=stage_executor,
+                on_progress=_progress_reporter(job_id),
+                on_stage_done=_checkpointer(job_id)
+            )
+        _complete_job(job_id, context, usage, memo_report)
+        status = 'completed'
         
     except Exception as e:
-        error_logger.log_error('process_brief', e, {'job_id': job_id, 'url': brand_url})
-        job_status[job_id]['status'] = 'failed'
-        job_status[job_id]['error'] = str(e)
-        job_status[job_id]['message'] = f'Error: {str(e)}'
-        print(f"Process brief error: {e}")
+        _fail_job(job_id, brand_url, e, usage)
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        JOB_LATENCY.observe(time.perf_counter() - start, status=status)
+        _record_shared_stats(job_id, shared)
+
+async def process_brief_async(job_id, brand_url, shared=None, checkpoints=None,
+                              deadline_seconds=BRIEF_DEADLINE_SECONDS, ai_mode=AI_MODE):
+    """Event-loop version of process_brief (PIPELINE_MODE=async)"""
+    JOBS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 'failed'
+    usage = TokenUsage()
+    memo_report = MemoReport()
+    try:
+        with deadline_scope(deadline_seconds), usage_scope(usage), memo_scope(memo_report):
+            context = await build_brief_pipeline().run_async(
+                _initial_context(job_id, brand_url, shared, checkpoints, ai_mode),
+                on_progress=_progress_reporter(job_id),
+                on_stage_done=_checkpointer(job_id)
+            )
+        # Job store writes block (SQLite), so keep them off the event loop
+        await asyncio.to_thread(_complete_job, job_id, context, usage, memo_report)
+        status = 'completed'
+
+    except Exception as e:
+        await asyncio.to_thread(_fail_job, job_id, brand_url, e, usage)
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        JOB_LATENCY.observe(time.perf_counter() - start, status=status)
+        await asyncio.to_thread(_record_shared_stats, job_id, shared)
+
+def _record_shared_stats(job_id, shared):
+    """Copy the batch's shared-work hit counts onto the batch record"""
+    if shared is None:
+        return
+    job = job_store.get(job_id)
+    if job and job.get('batch_id'):
+        job_store.update(job['batch_id'], shared_work=shared.get_stats())
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Re-run a failed job from its checkpoints: only the failed and downstream stages run"""
+    # A job orphaned by a worker restart is failed here, so it can be resumed
+    job = job_store.fail_if_stale(job_id)
+    if job is None or job.get('type') == 'batch':
+        return jsonify({'error': 'Job not found'}), 404
+    # Conditional update so two concurrent resume calls can't both restart the job
+    resumed = job_store.update(
+        job_id, expected_status='failed',
+        status='processing', error=None, message='Resuming...', failed_stage=None
+    )
+    if not resumed:
+        return jsonify({'error': f"Only failed jobs can be resumed (status: {job['status']})"}), 409
+    
+    checkpoints = job_store.load_checkpoints(job_id)
+    # The resumed run gets a fresh budget of the original size, and the same AI mode
+    deadline = job.get('deadline_seconds') or BRIEF_DEADLINE_SECONDS
+    ai_mode = job.get('ai_mode') or AI_MODE
+    
+    if PIPELINE_MODE == 'async':
+        runtime.submit(process_brief_async(job_id, job['url'], None, checkpoints, deadline_seconds=deadline,
+                                           ai_mode=ai_mode))
+    else:
+        executor.submit(process_brief, job_id, job['url'], None, checkpoints, deadline_seconds=deadline,
+                        ai_mode=ai_mode)
+    
+    return jsonify({'job_id': job_id, 'restored_stages': sorted(checkpoints)}), 202
 
 @app.route('/api/status/<job_id>')
 def check_status(job_id):
     """Check progress of generation"""
-    if job_id not in job_status:
+    job = job_store.fail_if_stale(job_id)
+    if job is None:
         return jsonify({'error': 'Job not found'}), 404
     
-    return jsonify(job_status[job_id])
+    return jsonify(job)
+
+@app.route('/api/batch/<batch_id>')
+def check_batch_status(batch_id):
+    """Per-URL progress for a batch"""
+    batch = job_store.get(batch_id)
+    if batch is None or batch.get('type') != 'batch':
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    jobs = []
+    for entry in batch['jobs']:
+        job = job_store.fail_if_stale(entry['job_id']) or {'status': 'failed', 'progress': 0, 'error': 'Job expired'}
+        jobs.append({
+            'url': entry['url'],
+            'job_id': entry['job_id'],
+            'status': job['status'],
+            'progress': job['progress'],
+            'message': job.get('message'),
+            'result': job.get('result'),
+            'error': job.get('error')
+        })
+    
+    finished = [job for job in jobs if job['status'] in ('completed', 'failed')]
+    return jsonify({
+        'batch_id': batch_id,
+        'status': 'completed' if len(finished) == len(jobs) else 'processing',
+        'progress': sum(job['progress'] or 0 for job in jobs) // max(len(jobs), 1),
+        'completed': len([job for job in finished if job['status'] == 'completed']),
+        'failed': len([job for job in finished if job['status'] == 'failed']),
+        'total': len(jobs),
+        'shared_work': batch.get('shared_work'),
+        'jobs': jobs
+    })
+
+@app.route('/api/status/<job_id>/stream')
+def stream_status(job_id):
+    """Push progress as Server-Sent Events until the job finishes"""
+    if job_store.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not stream_slots.acquire(blocking=False):
+        STREAMS_REJECTED.inc()
+        response = jsonify({'error': 'Too many open progress streams; poll /api/status instead'})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+
+    def events():
+        since = 0
+        while True:
+            job = job_store.fail_if_stale(job_id, job_store.wait_for_update(job_id, since, timeout=15))
+            if job is None:
+                yield 'event: failed\ndata: {"error": "Job not found"}\n\n'
+                return
+            if job['updated_at'] <= since:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+
+            since = job['updated_at']
+            if job['status'] in ('completed', 'failed'):
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                return
+            progress = {key: job.get(key) for key in ('status', 'progress', 'message', 'stages', 'partial_concepts')}
+            yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, even if the client left before the first event
+    response.call_on_close(stream_slots.release)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint (per worker process)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health')
 def health():
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark AIEngine's multi-call and fused generation modes
+Runs generate_brief() on the same input in each mode and compares latency,
+token usage and a few output-quality checks. Calls the real OpenAI API.
+
+Usage:
+    python benchmark_ai_modes.py [--runs 5] [--input brief_input.json] [--json]
+
+--input takes a JSON object with brand, competitors, meta_ads and
+reddit_problems (the AI stage's inputs); a built-in sample is used otherwise.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+# Every run must reach the API, or cached replies and memoized stages would skew the numbers
+os.environ['LLM_CACHE'] = 'off'
+os.environ['AI_STAGE_MEMO_TTL'] = '0'
+
+# Add project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.ai_engine import AIEngine, AI_MODES
+from modules.tokens import usage_scope
+
+SAMPLE_INPUT = {
+    'brand': {
+        'brand_name': 'GleeFull',
+        'url': 'https://gleefullsupps.com/',
+        'industry': 'health and wellness',
+        'niche': "women's hormone balance supplements",
+        'usp': ['Clinically studied ingredients', 'Made for perimenopause', 'Gummies instead of pills'],
+        'funnel_type': 'direct_purchase',
+        'keywords': ['hormone balance gummies', 'perimenopause supplement', 'menopause relief']
+    },
+    'competitors': [
+        {'brand_name': 'Bonafide', 'url': 'https://hellobonafide.com', 'funnel_type': 'quiz'},
+        {'brand_name': 'Estroven', 'url': 'https://estroven.com', 'funnel_type': 'direct_purchase'},
+        {'brand_name': 'Kindra', 'url': 'https://ourkindra.com', 'funnel_type': 'lead_magnet'}
+    ],
+    'meta_ads': [
+        {'advertiser_name': 'Bonafide', 'top_ads': [
+            {'headline': 'Hot flashes? There is a drug-free option', 'body': 'Clinically shown relief in 4 weeks.',
+             'cta': 'Shop Now', 'days_running': 120},
+            {'headline': 'Take the 60-second menopause quiz', 'body': 'Find the right relief for your symptoms.',
+             'cta': 'Learn More', 'days_running': 85}
+        ]},
+        {'advertiser_name': 'Estroven', 'top_ads': [
+            {'headline': 'Sleep through the night again', 'body': 'Our #1 formula for night sweats.',
+             'cta': 'Shop Now', 'days_running': 64}
+        ]}
+    ],
+    'reddit_problems': [
+        {'category': 'Sleep', 'count': 54, 'example_quote': 'I wake up drenched at 3am every night'},
+        {'category': 'Mood', 'count': 41, 'example_quote': 'My mood swings are ruining my relationships'},
+        {'category': 'Trust', 'count': 33, 'example_quote': 'Every supplement claims to work and none do'}
+    ]
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def quality(engine, brief):
+    """Cheap checks on a brief: how much of it came from the model rather than defaults"""
+    concepts = brief.get('ad_concepts', [])
+    defaults = {engine._get_default_concept(i)['headline'] for i in range(5)}
+    headlines = [c.get('headline', '') for c in concepts]
+    trends = brief.get('creative_trends', {})
+    return {
+        'model_concepts': sum(1 for h in headlines if h and h not in defaults),
+        'distinct_headlines': len(set(headlines)),
+        'concepts_with_pain_point': sum(1 for c in concepts if c.get('pain_point_addressed')),
+        'opportunities': len(brief.get('opportunities', [])),
+        'trend_fields_filled': sum(1 for value in trends.values() if value),
+        'default_trends': trends == engine._get_default_trends(),
+        'default_opportunities': brief.get('opportunities') == engine._get_default_opportunities()
+    }
+
+
+def run_mode(engine, data, mode, runs):
+    results = []
+    for i in range(runs):
+        with usage_scope() as usage:
+            start = time.perf_counter()
+            brief = engine.generate_brief(data, mode=mode)
+            elapsed = time.perf_counter() - start
+        results.append(dict(seconds=elapsed, usage=usage.summary(), quality=quality(engine, brief)))
+        print(f"  {mode} run {i + 1}/{runs}: {elapsed:.1f}s, {usage.summary()['total_tokens']} tokens")
+    return results
+
+
+def summarize(results):
+    seconds = [r['seconds'] for r in results]
+    usages = [r['usage'] for r in results]
+    qualities = [r['quality'] for r in results]
+    count = len(results)
+    return {
+        'p50_seconds': round(percentile(seconds, 50), 2),
+        'p95_seconds': round(percentile(seconds, 95), 2),
+        'mean_prompt_tokens': round(sum(u['prompt_tokens'] for u in usages) / count),
+        'mean_completion_tokens': round(sum(u['completion_tokens'] for u in usages) / count),
+        'mean_total_tokens': round(sum(u['total_tokens'] for u in usages) / count),
+        'mean_calls': round(sum(u['calls'] for u in usages) / count, 1),
+        'mean_model_concepts': round(sum(q['model_concepts'] for q in qualities) / count, 1),
+        'mean_distinct_headlines': round(sum(q['distinct_headlines'] for q in qualities) / count, 1),
+        'mean_concepts_with_pain_point': round(sum(q['concepts_with_pain_point'] for q in qualities) / count, 1),
+        'mean_trend_fields_filled': round(sum(q['trend_fields_filled'] for q in qualities) / count, 1),
+        'runs_with_default_trends': sum(1 for q in qualities if q['default_trends']),
+        'runs_with_default_opportunities': sum(1 for q in qualities if q['default_opportunities'])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare AIEngine's multi-call and fused modes")
+    parser.add_argument('--runs', type=int, default=5, help='Briefs per mode')
+    parser.add_argument('--input', help='JSON file with brand, competitors, meta_ads and reddit_problems')
+    parser.add_argument('--json', action='store_true', help='Print raw per-run results as JSON')
+    args = parser.parse_args()
+
+    if not os.environ.get('OPENAI_API_KEY'):
+        print("❌ OPENAI_API_KEY is not set")
+        return 1
+
+    data = SAMPLE_INPUT
+    if args.input:
+        with open(args.input) as f:
+            data = json.load(f)
+
+    engine = AIEngine()
+    results = {}
+    for mode in AI_MODES:
+        print(f"\nRunning {args.runs} briefs in '{mode}' mode...")
+        results[mode] = run_mode(engine, data, mode, args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    summaries = {mode: summarize(runs) for mode, runs in results.items()}
+    print("\n" + "=" * 60)
+    print(f"{'':34}" + ''.join(f"{mode:>13}" for mode in AI_MODES))
+    for field in summaries[AI_MODES[0]]:
+        print(f"{field:34}" + ''.join(f"{summaries[mode][field]:>13}" for mode in AI_MODES))
+    print("=" * 60)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
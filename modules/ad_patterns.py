@@ -0,0 +1,193 @@
+"""
+Local ad-pattern analysis
+Digests every fetched ad (not only the handful that fit in a prompt) into
+compact statistics for the trends prompt: headline n-grams, CTA mix, copy
+lengths and hook features. Each is also weighted by how long the ads have
+been running, since advertisers keep paying for the ads that work.
+"""
+import re
+import numpy as np
+
+TOP_NGRAMS = 10
+TOP_CTAS = 6
+TOP_EXAMPLES = 3
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the this to was with'.split())
+# Headline/body features that hint at the hook being used
+HOOK_PATTERNS = {
+    'question': re.compile(r'\?'),
+    'number': re.compile(r'\d'),
+    'second_person': re.compile(r"\byou(r|'re|rs)?\b", re.I),
+    'offer': re.compile(r'%|\b(free|off|save|deal|discount|sale)\b', re.I),
+    'urgency': re.compile(r'\b(now|today|tonight|limited|hurry|ends|last chance)\b', re.I),
+    'social_proof': re.compile(r'\b(thousands|millions|customers|reviews|rated|doctors?|experts?)\b', re.I),
+    'exclamation': re.compile(r'!')
+}
+
+
+def advertiser_ads(meta_ads):
+    """Flatten advertisers' top ads into one list, keeping the advertiser name on each ad"""
+    return [dict(ad, advertiser_name=advertiser.get('advertiser_name', ''))
+            for advertiser in meta_ads for ad in advertiser.get('top_ads', [])]
+
+
+def _days(value):
+    """Days running as a non-negative number; tolerates strings like '30 days' and treats junk as 0"""
+    try:
+        days = float(value or 0)
+    except (TypeError, ValueError):
+        match = re.search(r'\d+(\.\d+)?', str(value))
+        days = float(match.group()) if match else 0
+    return max(days, 0) if np.isfinite(days) else 0
+
+
+def _cta_label(cta):
+    return (cta or 'none').replace('_', ' ').strip().lower()
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9%']+", text.lower())
+
+
+def _ngrams(words):
+    """Distinct 1-3 word phrases that don't start or end with a stopword"""
+    grams = set()
+    for n in (1, 2, 3):
+        for i in range(len(words) - n + 1):
+            gram = words[i:i + n]
+            if gram[0] not in STOPWORDS and gram[-1] not in STOPWORDS:
+                grams.add(' '.join(gram))
+    return grams
+
+
+def _shares(matrix, weights):
+    """Plain and longevity-weighted fraction of ads per column of a 0/1 matrix"""
+    return matrix.mean(axis=0), weights @ matrix
+
+
+def _share_entry(share, weighted):
+    return {'share': round(float(share), 2), 'weighted_share': round(float(weighted), 2)}
+
+
+def _length_stats(lengths, long_running):
+    p25, median, p75 = np.percentile(lengths, [25, 50, 75])
+    return {
+        'median': float(median),
+        'p25': float(p25),
+        'p75': float(p75),
+        'long_running_median': float(np.median(lengths[long_running]))
+    }
+
+
+def _headline_ngrams(headlines, weights):
+    grams = [_ngrams(_words(headline)) for headline in headlines]
+    vocab = sorted(set().union(*grams))
+    if not vocab:
+        return []
+    index = {gram: i for i, gram in enumerate(vocab)}
+    matrix = np.zeros((len(headlines), len(vocab)))
+    for row, ad_grams in enumerate(grams):
+        matrix[row, [index[gram] for gram in ad_grams]] = 1
+    counts = matrix.sum(axis=0)
+    share, weighted = _shares(matrix, weights)
+    # Phrases seen in a single ad are noise once there are a few ads
+    weighted = np.where(counts >= min(2, len(headlines)), weighted, 0)
+    # Longest phrase first among equal scores, so its fragments can be dropped below
+    lengths = np.array([gram.count(' ') for gram in vocab])
+    top = []
+    for i in np.lexsort((-lengths, -weighted)):
+        if weighted[i] <= 0 or len(top) == TOP_NGRAMS:
+            break
+        # "why doctors" adds nothing next to "why doctors recommend" if both are in the same ads
+        if not any(f' {vocab[i]} ' in f' {vocab[j]} ' and np.array_equal(matrix[:, i], matrix[:, j]) for j in top):
+            top.append(i)
+    return [dict(ngram=vocab[i], ads=int(counts[i]), **_share_entry(share[i], weighted[i])) for i in top]
+
+
+def _cta_mix(ctas, weights):
+    labels = [_cta_label(cta) for cta in ctas]
+    names, inverse = np.unique(labels, return_inverse=True)
+    share = np.bincount(inverse, minlength=len(names)) / len(labels)
+    weighted = np.bincount(inverse, weights=weights, minlength=len(names))
+    order = np.argsort(-weighted, kind='stable')[:TOP_CTAS]
+    return [dict(cta=str(names[i]), **_share_entry(share[i], weighted[i])) for i in order]
+
+
+def digest_ads(ads):
+    """
+    Statistical summary of `ads` (dicts with headline, body, cta, days_running)
+    `share` is the fraction of ads with a feature; `weighted_share` weights
+    each ad by log(days running), so a feature whose weighted share beats its
+    share is over-represented in long-running ads. Returns None without ads.
+    """
+    ads = [ad for ad in ads if ad.get('headline') or ad.get('body')]
+    if not ads:
+        return None
+
+    headlines = [ad.get('headline') or '' for ad in ads]
+    bodies = [ad.get('body') or '' for ad in ads]
+    days = np.array([_days(ad.get('days_running')) for ad in ads])
+    weights = 1 + np.log1p(days)
+    weights /= weights.sum()
+    long_running = days >= np.percentile(days, 75)
+
+    hooks = np.array([[bool(pattern.search(f"{headline} {body}")) for pattern in HOOK_PATTERNS.values()]
+                      for headline, body in zip(headlines, bodies)], dtype=float)
+    hook_share, hook_weighted = _shares(hooks, weights)
+
+    headline_words = np.array([len(_words(headline)) for headline in headlines])
+    body_words = np.array([len(_words(body)) for body in bodies])
+
+    examples = []
+    for i in np.argsort(-days, kind='stable'):
+        if headlines[i] and headlines[i] not in [example['headline'] for example in examples]:
+            examples.append({'headline': headlines[i], 'cta': _cta_label(ads[i].get('cta')), 'days_running': int(days[i])})
+        if len(examples) == TOP_EXAMPLES:
+            break
+
+    return {
+        'ads': len(ads),
+        'advertisers': len({ad.get('advertiser_name') for ad in ads}),
+        'days_running': {
+            'median': float(np.median(days)),
+            'p75': float(np.percentile(days, 75)),
+            'max': float(days.max())
+        },
+        'headline_ngrams': _headline_ngrams(headlines, weights),
+        'ctas': _cta_mix([ad.get('cta') for ad in ads], weights),
+        'hooks': {name: _share_entry(hook_share[i], hook_weighted[i]) for i, name in enumerate(HOOK_PATTERNS)},
+        'lengths': {
+            'headline_words': _length_stats(headline_words, long_running),
+            'body_words': _length_stats(body_words, long_running)
+        },
+        'longest_running': examples
+    }
+
+
+def _shares_text(entry):
+    return f"{entry['share']:.0%}/{entry['weighted_share']:.0%}"
+
+
+def stats_lines(digest):
+    """Days running, lengths, CTA mix and hooks as a few compact prompt lines"""
+    def lengths(stats):
+        return (f"median {stats['median']:g} (p25 {stats['p25']:g}, p75 {stats['p75']:g}), "
+                f"long-running median {stats['long_running_median']:g}")
+
+    days = digest['days_running']
+    return '\n'.join([
+        f"Days running: median {days['median']:g}, p75 {days['p75']:g}, max {days['max']:g}",
+        f"Headline words: {lengths(digest['lengths']['headline_words'])}",
+        f"Body words: {lengths(digest['lengths']['body_words'])}",
+        'CTAs: ' + ', '.join(f"{cta['cta']} {_shares_text(cta)}" for cta in digest['ctas']),
+        'Hooks: ' + ', '.join(f"{name} {_shares_text(entry)}" for name, entry in digest['hooks'].items())
+    ])
+
+
+def ngram_lines(ngrams):
+    return '\n'.join(f"{ngram['ngram']} ({ngram['ads']} ads) {_shares_text(ngram)}" for ngram in ngrams)
+
+
+def example_lines(examples):
+    return '\n'.join(f"{example['headline']} [{example['cta']}, {example['days_running']} days]"
+                     for example in examples)
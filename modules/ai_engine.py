@@ -1,15 +1,33 @@
 import os
 import json
-from .openai_helper import get_openai_client
+import asyncio
+import contextvars
+from .openai_helper import get_openai_client, fanout_pool
 from .error_logger import error_logger
+from .async_runtime import call_upstream
+from .json_stream import JSONArrayStream
+from .schemas import response_format, parse_response, parse_item
+from .tokens import fit_prompt, Section
+from .stage_memo import stage_memo
+from .diversity import select_diverse
+from .ad_patterns import digest_ads, advertiser_ads, stats_lines, ngram_lines, example_lines
+
+# 'multi': trends, opportunities and concepts as separate calls; 'fused': one call for all three
+AI_MODES = ('multi', 'fused')
+# Concepts to request per brief; above 5, the 5 most diverse candidates are kept
+AI_CONCEPT_CANDIDATES = max(int(os.environ.get('AI_CONCEPT_CANDIDATES', 5)), 5)
 
 class AIEngine:
     def __init__(self):
         self.client = get_openai_client()
-        self.model = "gpt-5-mini"  # Using gpt-5-mini for best balance of quality and cost
         
-    def generate_brief(self, data):
-        """Generate complete creative strategy brief"""
+    def generate_brief(self, data, on_concept=None, mode='multi'):
+        """
+        Generate complete creative strategy brief
+        `on_concept(concepts)` is called with the concepts so far as each one streams in.
+        With mode='fused', one request produces trends, opportunities and concepts;
+        if it fails, the brief falls back to the separate calls.
+        """
         try:
             # Extract data components
             brand = data.get('brand', {})
@@ -17,61 +35,106 @@ class AIEngine:
             meta_ads = data.get('meta_ads', [])
             reddit_problems = data.get('reddit_problems', [])
             
-            # Step 1: Analyze creative trends
-            trends = self._analyze_trends(meta_ads)
+            if mode == 'fused':
+                fused = self._generate_fused(brand, competitors, meta_ads, reddit_problems)
+                if fused is not None:
+                    if on_concept is not None:
+                        on_concept(fused[2])
+                    return self._compile_brief(data, *fused)
             
-            # Step 2: Identify opportunities
+            # Steps 1 and 2 are independent: analyze trends on the fan-out pool while
+            # opportunities run here. Each step falls back to its defaults on its own.
+            trends_future = fanout_pool.submit(contextvars.copy_context().run, self._analyze_trends, self._ad_digest(data))
             opportunities = self._find_opportunities(brand, competitors, meta_ads, reddit_problems)
+            trends = trends_future.result()
             
-            # Step 3: Generate ad concepts
-            concepts = self._generate_concepts(brand, trends, opportunities, reddit_problems)
-            
-            # Compile full brief
-            brief = {
-                'brand_overview': {
-                    'brand_name': brand.get('brand_name', 'Unknown'),
-                    'website': brand.get('url', ''),
-                    'industry': brand.get('industry', 'Unknown'),
-                    'niche': brand.get('niche', 'Unknown'),
-                    'usp': brand.get('usp', []),
-                    'funnel_type': brand.get('funnel_type', 'Unknown'),
-                    'keywords': brand.get('keywords', [])
-                },
-                'competitors': competitors,
-                'meta_advertisers': meta_ads,
-                'reddit_problems': reddit_problems,
-                'creative_trends': trends,
-                'opportunities': opportunities,
-                'ad_concepts': concepts
-            }
+            # Step 3: Generate ad concepts once both are ready
+            concepts = self._generate_concepts(brand, trends, opportunities, reddit_problems, on_concept)
             
-            return brief
+            return self._compile_brief(data, trends, opportunities, concepts)
             
         except Exception as e:
             error_logger.log_error('AIEngine.generate_brief', e)
             print(f"AI generation error: {e}")
             return self._get_fallback_brief(data)
+
+    async def generate_brief_async(self, data, on_concept=None, mode='multi'):
+        """Async generate_brief(); each LLM step waits on the OpenAI concurrency limit"""
+        try:
+            brand = data.get('brand', {})
+            competitors = data.get('competitors', [])
+            meta_ads = data.get('meta_ads', [])
+            reddit_problems = data.get('reddit_problems', [])
+
+            if mode == 'fused':
+                fused = await call_upstream(
+                    'openai', self._generate_fused, brand, competitors, meta_ads, reddit_problems
+                )
+                if fused is not None:
+                    if on_concept is not None:
+                        # Publishing writes to the job store, which must not block the loop
+                        await asyncio.to_thread(on_concept, fused[2])
+                    return self._compile_brief(data, *fused)
+
+            trends, opportunities = await asyncio.gather(
+                call_upstream('openai', self._analyze_trends, self._ad_digest(data)),
+                call_upstream('openai', self._find_opportunities, brand, competitors, meta_ads, reddit_problems)
+            )
+            concepts = await call_upstream(
+                'openai', self._generate_concepts, brand, trends, opportunities, reddit_problems, on_concept
+            )
+
+            return self._compile_brief(data, trends, opportunities, concepts)
+
+        except Exception as e:
+            error_logger.log_error('AIEngine.generate_brief', e)
+            print(f"AI generation error: {e}")
+            return self._get_fallback_brief(data)
+
+    def _compile_brief(self, data, trends, opportunities, concepts):
+        """Compile full brief"""
+        brand = data.get('brand', {})
+        return {
+            'brand_overview': {
+                'brand_name': brand.get('brand_name', 'Unknown'),
+                'website': brand.get('url', ''),
+                'industry': brand.get('industry', 'Unknown'),
+                'niche': brand.get('niche', 'Unknown'),
+                'usp': brand.get('usp', []),
+                'funnel_type': brand.get('funnel_type', 'Unknown'),
+                'keywords': brand.get('keywords', [])
+            },
+            'competitors': data.get('competitors', []),
+            'meta_advertisers': data.get('meta_ads', []),
+            'reddit_problems': data.get('reddit_problems', []),
+            'creative_trends': trends,
+            'opportunities': opportunities,
+            'ad_concepts': concepts
+        }
+    
+    def _ad_digest(self, data):
+        """The pipeline's ad_patterns digest, or one built from the top advertisers' ads"""
+        if 'ad_digest' in data:
+            return data['ad_digest']
+        return digest_ads(advertiser_ads(data.get('meta_ads', [])))
     
-    def _analyze_trends(self, meta_ads):
-        """Analyze creative trends from Meta ads"""
-        if not meta_ads:
+    def _analyze_trends(self, digest):
+        """Analyze creative trends from the ad-pattern digest (see modules/ad_patterns.py)"""
+        if not digest:
             return self._get_default_trends()
         
-        # Prepare ads data for analysis
-        ads_summary = []
-        for advertiser in meta_ads[:3]:
-            for ad in advertiser.get('top_ads', [])[:3]:
-                ads_summary.append({
-                    'headline': ad.get('headline', ''),
-                    'body': ad.get('body', ''),
-                    'cta': ad.get('cta', ''),
-                    'days_running': ad.get('days_running', 0)
-                })
-        
-        prompt = f"""Analyze these top-performing Meta ads and identify creative trends:
+        # Examples go first, then the rarer n-grams, if the prompt doesn't fit its budget
+        prompt = fit_prompt('AIEngine._analyze_trends', """Identify creative trends from these statistics on {ads} running Meta ads from {advertisers} advertisers.
+Percentages are shown as share/weighted share: the share of ads with the feature, then the same share with each ad weighted by how long it has been running. A weighted share above the plain share means the feature is more common in long-running, successful ads.
 
-Ads Data:
-{json.dumps(ads_summary, indent=2)}
+Ad Statistics:
+{stats}
+
+Top Headline Phrases:
+{ngrams}
+
+Longest-Running Headlines:
+{examples}
 
 Provide a JSON response with:
 1. headline_patterns - Array of 3-5 common headline patterns/styles
@@ -79,32 +142,54 @@ Provide a JSON response with:
 3. cta_styles - Array of 3-5 effective CTA approaches
 4. hook_types - Array of 3-5 successful hook strategies
 
-Focus on patterns that appear in long-running, successful ads."""
+Focus on patterns that are over-represented in long-running ads.""",
+            ads=digest['ads'],
+            advertisers=digest['advertisers'],
+            stats=stats_lines(digest),
+            ngrams=Section(digest['headline_ngrams'], priority=1, minimum=5, render=ngram_lines),
+            examples=Section(digest['longest_running'], minimum=1, render=example_lines))
+
+        # The fitted prompt holds exactly the (trimmed) digest, so it keys the memo
+        memo_key = stage_memo.key('AIEngine._analyze_trends', prompt)
+        trends = stage_memo.get('AIEngine._analyze_trends', memo_key)
+        if trends is not None:
+            return trends
 
         try:
             response = self.client.chat.completions.create(
-                model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a creative strategist analyzing ad trends. Respond with valid JSON only."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=500,
+                call_site='AIEngine._analyze_trends',
+                hedge=True,
+                response_format=response_format('creative_trends')
             )
             
-            result = response.choices[0].message.content
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.endswith('```'):
-                result = result[:-3]
-            
-            return json.loads(result.strip())
+            trends = parse_response('creative_trends', response.choices[0].message.content)
+            stage_memo.set(memo_key, trends)
+            return trends
             
         except Exception as e:
             error_logger.log_error('AIEngine._analyze_trends', e)
             print(f"Trend analysis error: {e}")
             return self._get_default_trends()
     
+    def _ads_summary(self, meta_ads):
+        """Headline, body, CTA and run length of the top advertisers' top ads"""
+        ads_summary = []
+        for advertiser in meta_ads[:3]:
+            for ad in advertiser.get('top_ads', [])[:3]:
+                ads_summary.append({
+                    'headline': ad.get('headline', ''),
+                    'body': ad.get('body', ''),
+                    'cta': ad.get('cta', ''),
+                    'days_running': ad.get('days_running', 0)
+                })
+        return ads_summary
+    
     def _find_opportunities(self, brand, competitors, meta_ads, reddit_problems):
         """Identify strategic opportunities"""
         prompt = f"""Based on this competitive analysis, identify strategic opportunities:
@@ -136,36 +221,47 @@ Provide a JSON response with exactly 3 opportunities:
 
 Focus on gaps in the current market that align with customer pain points."""
 
+        memo_key = stage_memo.key('AIEngine._find_opportunities', prompt)
+        opportunities = stage_memo.get('AIEngine._find_opportunities', memo_key)
+        if opportunities is not None:
+            return opportunities
+
         try:
             response = self.client.chat.completions.create(
-                model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a strategic marketing consultant. Respond with valid JSON only."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.8,
-                max_tokens=600
+                max_tokens=600,
+                call_site='AIEngine._find_opportunities',
+                hedge=True,
+                response_format=response_format('opportunities')
             )
             
-            result = response.choices[0].message.content
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.endswith('```'):
-                result = result[:-3]
-            
-            return json.loads(result.strip())
+            opportunities = parse_response('opportunities', response.choices[0].message.content)
+            if not opportunities:
+                # Nothing usable: fall back without memoizing the empty reply
+                return self._get_default_opportunities()
+            stage_memo.set(memo_key, opportunities)
+            return opportunities
             
         except Exception as e:
             error_logger.log_error('AIEngine._find_opportunities', e)
             print(f"Opportunity analysis error: {e}")
             return self._get_default_opportunities()
     
-    def _generate_concepts(self, brand, trends, opportunities, reddit_problems):
-        """Generate 5 ad concepts"""
+    def _generate_concepts(self, brand, trends, opportunities, reddit_problems, on_concept=None):
+        """
+        Generate 5 ad concepts; streamed when `on_concept` wants them as they arrive
+        With AI_CONCEPT_CANDIDATES above 5, that many are requested in the same
+        call and the 5 most diverse are kept.
+        """
         # Prepare context
         pain_points = [p.get('example_quote', '') for p in reddit_problems[:3]]
+        candidates = AI_CONCEPT_CANDIDATES
         
-        prompt = f"""Generate 5 unique static ad concepts for this brand:
+        prompt = f"""Generate {candidates} unique static ad concepts for this brand:
 
 Brand: {brand.get('brand_name')}
 Industry: {brand.get('industry')}
@@ -181,7 +277,7 @@ Strategic Opportunities:
 Current Trends to Consider:
 {json.dumps(trends.get('headline_patterns', [])[:3])}
 
-Generate exactly 5 ad concepts with this JSON structure:
+Generate exactly {candidates} ad concepts with this JSON structure:
 [
   {{
     "hook_type": "problem|solution|story|comparison|question|statistic",
@@ -196,41 +292,161 @@ Generate exactly 5 ad concepts with this JSON structure:
 
 Make each concept unique and aligned with different opportunities/angles."""
 
+        memo_key = stage_memo.key('AIEngine._generate_concepts', prompt)
+        concepts = stage_memo.get('AIEngine._generate_concepts', memo_key)
+        if concepts is not None:
+            if on_concept is not None:
+                on_concept(concepts)
+            return concepts
+
         try:
             response = self.client.chat.completions.create(
-                model=self.model,
                 messages=[
                     {"role": "system", "content": "You are an expert copywriter creating high-converting ad concepts. Respond with valid JSON only."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.9,
-                max_tokens=1500
+                max_tokens=300 * candidates,
+                call_site='AIEngine._generate_concepts',
+                hedge=True,
+                response_format=response_format('ad_concepts'),
+                stream=on_concept is not None
             )
             
-            result = response.choices[0].message.content
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.endswith('```'):
-                result = result[:-3]
+            concepts = None
+            if on_concept is not None:
+                concepts, result = self._collect_streamed_concepts(response, on_concept, limit=candidates)
+            else:
+                result = response.choices[0].message.content
             
-            concepts = json.loads(result.strip())
+            if not concepts:
+                # Not streamed, or nothing complete came out of the stream: parse the full text
+                concepts = parse_response('ad_concepts', result)
             
-            # Ensure we have exactly 5 concepts
-            if len(concepts) > 5:
-                concepts = concepts[:5]
-            elif len(concepts) < 5:
-                # Generate additional concepts if needed
-                additional = 5 - len(concepts)
-                for i in range(additional):
-                    concepts.append(self._get_default_concept(i))
+            if candidates > 5:
+                concepts = self._pick_concepts(concepts, brand, opportunities, pain_points)
+                if on_concept is not None:
+                    # The stream showed every candidate; replace them with the ones kept
+                    on_concept(list(concepts))
             
-            return concepts
+            if len(concepts) >= 5:
+                # Only a full set from the model is reused; padded sets are regenerated next time
+                stage_memo.set(memo_key, concepts[:5])
+            return self._five_concepts(concepts)
             
         except Exception as e:
             error_logger.log_error('AIEngine._generate_concepts', e)
             print(f"Concept generation error: {e}")
             return [self._get_default_concept(i) for i in range(5)]
     
+    def _pick_concepts(self, concepts, brand, opportunities, pain_points):
+        """The 5 candidates closest to the brief's context and least alike each other"""
+        concepts = [c for c in concepts if c.get('headline')]
+        if len(concepts) <= 5:
+            return concepts
+        context = [brand.get('niche') or '', *map(str, brand.get('usp', [])), *pain_points,
+                   *[opp.get('title', '') for opp in opportunities[:3]]]
+        picks = select_diverse(
+            [f"{c.get('headline', '')} {c.get('body_copy', '')}" for c in concepts], ' '.join(context), 5)
+        return [concepts[i] for i in picks]
+    
+    def _five_concepts(self, concepts):
+        """Ensure we have exactly 5 concepts"""
+        if len(concepts) > 5:
+            concepts = concepts[:5]
+        elif len(concepts) < 5:
+            # Generate additional concepts if needed
+            additional = 5 - len(concepts)
+            for i in range(additional):
+                concepts.append(self._get_default_concept(i))
+        return concepts
+    
+    def _generate_fused(self, brand, competitors, meta_ads, reddit_problems):
+        """
+        Trends, opportunities and concepts from a single request
+        The brand context is sent once instead of three times. Returns
+        (trends, opportunities, concepts), or None if the call fails.
+        """
+        ads_summary = self._ads_summary(meta_ads)
+        
+        # Ads are dropped from the end if the prompt doesn't fit its budget
+        prompt = fit_prompt('AIEngine._generate_fused', """Create a creative strategy for this brand.
+
+Brand: {brand_name}
+Industry: {industry}
+Niche: {niche}
+Current USP: {usp}
+
+Competitors: {competitor_count} analyzed
+Common funnel types: {funnel_types}
+
+Top Customer Pain Points (from Reddit):
+{pain_points}
+
+Top-performing Meta ads:
+{ads}
+
+Provide a JSON object with:
+1. creative_trends - Trends in the ads above: headline_patterns, visual_themes, cta_styles and hook_types
+   (3-5 each). Focus on patterns in long-running, successful ads.
+2. opportunities - Exactly 3 strategic opportunities (type: angle|design|funnel, title, description,
+   implementation): gaps in the current market that align with customer pain points.
+3. concepts - Exactly 5 unique static ad concepts (hook_type, headline, body_copy of 2-3 lines, cta,
+   visual_direction, rationale, pain_point_addressed), each built on a different opportunity or angle
+   and informed by the trends.""",
+            brand_name=brand.get('brand_name'),
+            industry=brand.get('industry'),
+            niche=brand.get('niche'),
+            usp=json.dumps(brand.get('usp', [])),
+            competitor_count=len(competitors),
+            funnel_types=[c.get('funnel_type') for c in competitors[:3]],
+            pain_points=json.dumps([p.get('example_quote') for p in reddit_problems[:3]]),
+            ads=Section(ads_summary, minimum=3, render=lambda ads: json.dumps(ads, indent=2)))
+
+        memo_key = stage_memo.key('AIEngine._generate_fused', prompt)
+        memoized = stage_memo.get('AIEngine._generate_fused', memo_key)
+        if memoized is not None:
+            return memoized['creative_trends'], memoized['opportunities'], memoized['concepts']
+
+        try:
+            response = self.client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": "You are a creative strategist and expert copywriter. Respond with valid JSON only."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.9,
+                max_tokens=2500,
+                call_site='AIEngine._generate_fused',
+                hedge=True,
+                response_format=response_format('fused_brief')
+            )
+            
+            result = parse_response('fused_brief', response.choices[0].message.content)
+            if any(result['creative_trends'].values()) and result['opportunities'] and len(result['concepts']) >= 5:
+                stage_memo.set(memo_key, dict(result, concepts=result['concepts'][:5]))
+            trends = result['creative_trends'] if any(result['creative_trends'].values()) else self._get_default_trends()
+            opportunities = result['opportunities'] or self._get_default_opportunities()
+            return trends, opportunities, self._five_concepts(result['concepts'])
+            
+        except Exception as e:
+            error_logger.log_error('AIEngine._generate_fused', e)
+            print(f"Fused brief generation error, using separate calls: {e}")
+            return None
+    
+    def _collect_streamed_concepts(self, chunks, on_concept, limit=5):
+        """Read a streamed concepts response, reporting each concept as soon as it closes"""
+        parser = JSONArrayStream()
+        concepts = []
+        text = []
+        for chunk in chunks:
+            text.append(chunk)
+            for item in parser.feed(chunk):
+                item = parse_item('ad_concepts', item)
+                if item is not None and len(concepts) < limit:
+                    concepts.append(item)
+                    on_concept(list(concepts))
+        return concepts, ''.join(text)
+    
     def _get_default_trends(self):
         """Return default trends structure"""
         return {
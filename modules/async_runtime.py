@@ -0,0 +1,89 @@
+"""
+Event-loop runtime for the async pipeline mode
+Every job runs as a coroutine on one background loop per process. A job only
+borrows a worker thread while one of its upstream calls is actually on the
+wire, and each upstream has its own concurrency limit, so hundreds of briefs
+can be in flight without hundreds of blocked threads.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics
+
+# Max simultaneous calls per upstream (across all jobs in this process)
+UPSTREAM_LIMITS = {
+    'openai': int(os.environ.get('OPENAI_CONCURRENCY', 32)),
+    'foreplay': int(os.environ.get('FOREPLAY_CONCURRENCY', 8)),
+    'duckduckgo': int(os.environ.get('DUCKDUCKGO_CONCURRENCY', 4)),
+    'website': int(os.environ.get('WEBSITE_CONCURRENCY', 16)),
+    'coda': int(os.environ.get('CODA_CONCURRENCY', 4))
+}
+
+
+class AsyncRuntime:
+    """Background event loop plus per-upstream semaphores"""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or UPSTREAM_LIMITS)
+        self.loop = None
+        self._semaphores = {}
+        self._in_use = {}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the loop thread on first use"""
+        with self._lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            # Enough threads for every upstream to be at its limit at once
+            loop.set_default_executor(ThreadPoolExecutor(
+                max_workers=sum(self.limits.values()), thread_name_prefix='upstream'
+            ))
+            threading.Thread(target=loop.run_forever, name='brief-event-loop', daemon=True).start()
+            self.loop = loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop from any thread; returns a concurrent Future"""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _semaphore(self, upstream):
+        if upstream not in self._semaphores:
+            self._semaphores[upstream] = asyncio.Semaphore(self.limits.get(upstream, 4))
+        return self._semaphores[upstream]
+
+    async def call(self, upstream, func, *args, **kwargs):
+        """Run a blocking upstream call in the thread pool under that upstream's limit"""
+        async with self._semaphore(upstream):
+            self._in_use[upstream] = self._in_use.get(upstream, 0) + 1
+            try:
+                return await asyncio.to_thread(func, *args, **kwargs)
+            finally:
+                self._in_use[upstream] -= 1
+
+    def get_stats(self):
+        """Current usage of each upstream limit"""
+        return {
+            upstream: {'limit': limit, 'in_use': self._in_use.get(upstream, 0)}
+            for upstream, limit in self.limits.items()
+        }
+
+
+# Global runtime instance
+runtime = AsyncRuntime()
+
+metrics.gauge(
+    'upstream_concurrency_in_use', 'Async-mode upstream calls currently holding a slot', ['upstream'],
+    callback=lambda: [({'upstream': name}, stats['in_use']) for name, stats in runtime.get_stats().items()]
+)
+metrics.gauge(
+    'upstream_concurrency_limit', 'Async-mode concurrency limit per upstream', ['upstream'],
+    callback=lambda: [({'upstream': name}, stats['limit']) for name, stats in runtime.get_stats().items()]
+)
+
+
+async def call_upstream(upstream, func, *args, **kwargs):
+    """Shortcut for runtime.call() used by the client *_async methods"""
+    return await runtime.call(upstream, func, *args, **kwargs)
@@ -1,10 +1,15 @@
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
 import re
 import os
 from .openai_helper import get_openai_client
 from .error_logger import error_logger
+from .async_runtime import call_upstream
+from .metrics import track_upstream
+from .clients import get_session
+from .deadline import call_timeout
+from .schemas import response_format, parse_response
+from .tokens import fit_prompt, Section
 
 class BrandAnalyzer:
     def __init__(self):
@@ -17,44 +22,71 @@ class BrandAnalyzer:
         """Analyze brand website and extract key information"""
         try:
             # Normalize URL
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
+            url = self._normalize_url(url)
             
-            # Fetch homepage
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract basic info
-            brand_name = self._extract_brand_name(soup, url)
-            meta_description = self._extract_meta_description(soup)
-            
-            # Extract text content
-            text_content = self._extract_text_content(soup)
+            # Fetch homepage and extract basic info
+            page = self._fetch_page(url)
             
             # Use AI to analyze the content
-            analysis = self._ai_analyze(text_content, meta_description, url)
+            analysis = self._ai_analyze(page['text_content'], page['meta_description'], url)
             
-            # Add extracted data
-            analysis['brand_name'] = brand_name
-            analysis['url'] = url
-            analysis['meta_description'] = meta_description
-            
-            return analysis
+            return self._compile_analysis(analysis, page, url)
             
         except Exception as e:
-            error_logger.log_error('BrandAnalyzer.analyze', e, {'url': url})
-            print(f"Error analyzing brand: {e}")
-            # Return minimal data on error
-            return {
-                'brand_name': urlparse(url).netloc,
-                'url': url,
-                'industry': 'Unknown',
-                'niche': 'Unknown',
-                'usp': ['Unable to determine'],
-                'funnel_type': 'Unknown',
-                'keywords': [urlparse(url).netloc.replace('.com', '')]
-            }
+            return self._handle_error(e, url)
+
+    async def analyze_async(self, url):
+        """Async analyze(); the page fetch and the AI call each wait on their own upstream limit"""
+        try:
+            url = self._normalize_url(url)
+            page = await call_upstream('website', self._fetch_page, url)
+            analysis = await call_upstream(
+                'openai', self._ai_analyze, page['text_content'], page['meta_description'], url
+            )
+            return self._compile_analysis(analysis, page, url)
+
+        except Exception as e:
+            return self._handle_error(e, url)
+
+    def _normalize_url(self, url):
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        return url
+
+    def _fetch_page(self, url):
+        """Fetch the homepage and pull out name, description and body text"""
+        timeout = call_timeout('website', 10)
+        with track_upstream('website', 'homepage'):
+            response = get_session('website').get(url, headers=self.headers, timeout=timeout)
+            response.raise_for_status()
+        soup = BeautifulSoup(response.text, 'html.parser')
+        
+        return {
+            'brand_name': self._extract_brand_name(soup, url),
+            'meta_description': self._extract_meta_description(soup),
+            'text_content': self._extract_text_content(soup)
+        }
+
+    def _compile_analysis(self, analysis, page, url):
+        """Add extracted data to the AI analysis"""
+        analysis['brand_name'] = page['brand_name']
+        analysis['url'] = url
+        analysis['meta_description'] = page['meta_description']
+        return analysis
+
+    def _handle_error(self, e, url):
+        """Log the error and return minimal data"""
+        error_logger.log_error('BrandAnalyzer.analyze', e, {'url': url})
+        print(f"Error analyzing brand: {e}")
+        return {
+            'brand_name': urlparse(url).netloc,
+            'url': url,
+            'industry': 'Unknown',
+            'niche': 'Unknown',
+            'usp': ['Unable to determine'],
+            'funnel_type': 'Unknown',
+            'keywords': [urlparse(url).netloc.replace('.com', '')]
+        }
     
     def _extract_brand_name(self, soup, url):
         """Extract brand name from website"""
@@ -117,11 +149,12 @@ class BrandAnalyzer:
     
     def _ai_analyze(self, text_content, meta_description, url):
         """Use AI to analyze the brand"""
-        prompt = f"""Analyze this brand website and extract the following information:
+        # Page text is cut to fit the prompt budget (see modules/tokens.py)
+        prompt = fit_prompt('BrandAnalyzer._ai_analyze', """Analyze this brand website and extract the following information:
 
 URL: {url}
 Meta Description: {meta_description}
-Website Content: {text_content[:2000]}
+Website Content: {text_content}
 
 Please provide a JSON response with:
 1. industry - The primary industry (e.g., "e-commerce", "SaaS", "healthcare", "finance")
@@ -130,29 +163,22 @@ Please provide a JSON response with:
 4. funnel_type - The primary conversion funnel type: "direct_purchase", "lead_magnet", "quiz", "vsl", "free_trial", "demo_request", or "other"
 5. keywords - Array of 5-10 relevant keywords for finding competitors and ads
 
-Respond with valid JSON only."""
+Respond with valid JSON only.""", url=url, meta_description=meta_description,
+            text_content=Section(text_content, minimum=500))
 
         try:
             response = self.client.chat.completions.create(
-                model="gpt-5-mini",  # Using gpt-5-mini for best balance of quality and cost
                 messages=[
                     {"role": "system", "content": "You are a marketing analyst. Respond with valid JSON only."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=500,
+                call_site='BrandAnalyzer._ai_analyze',
+                response_format=response_format('brand_analysis')
             )
             
-            # Parse JSON response
-            import json
-            result = response.choices[0].message.content
-            # Clean up response if needed
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.endswith('```'):
-                result = result[:-3]
-            
-            return json.loads(result.strip())
+            return parse_response('brand_analysis', response.choices[0].message.content)
             
         except Exception as e:
             error_logger.log_error('BrandAnalyzer._ai_analyze', e, {
@@ -0,0 +1,123 @@
+"""
+Two-tier content-addressed cache
+Entries live in a process-local LRU (sub-millisecond hits) backed by a SQLite
+file shared by every worker on the host, so a result computed by one worker
+or before a restart is still a hit. Every entry has its own TTL.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from .metrics import CACHE_REQUESTS
+
+CACHE_DB_PATH = os.environ.get('CACHE_DB_PATH', 'cache.db')
+
+
+def cache_key(*parts):
+    """Stable hash of JSON-serialisable parts (dict key order doesn't matter)"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TieredCache:
+    """Memory LRU in front of a SQLite table; values must be JSON-serialisable"""
+
+    def __init__(self, namespace, max_entries=1024, path=CACHE_DB_PATH):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_eviction = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._init_schema()
+
+    def _connect(self):
+        """One connection per thread, like the job store"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache_entries (expires_at);
+        ''')
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                CACHE_REQUESTS.inc(cache=self.namespace, result='hit')
+                return entry[0]
+
+        try:
+            row = self._connect().execute(
+                'SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?',
+                (self.namespace, key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Cache read error ({self.namespace}): {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._memory.pop(key, None)
+                self.stats['misses'] += 1
+                CACHE_REQUESTS.inc(cache=self.namespace, result='miss')
+                return None
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self.stats['disk_hits'] += 1
+            CACHE_REQUESTS.inc(cache=self.namespace, result='hit')
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value in both tiers for `ttl` seconds"""
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+        try:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                (self.namespace, key, json.dumps(value), expires_at)
+            )
+            self._maybe_evict()
+        except sqlite3.Error as e:
+            print(f"Cache write error ({self.namespace}): {e}")
+
+    def _remember(self, key, value, expires_at):
+        """Put an entry in the memory tier, dropping the least recently used (lock held)"""
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _maybe_evict(self):
+        """Drop expired rows from disk at most once a minute"""
+        now = time.time()
+        if now - self._last_eviction > 60:
+            self._last_eviction = now
+            self._connect().execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._memory), max_entries=self.max_entries)
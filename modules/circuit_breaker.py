@@ -0,0 +1,129 @@
+"""
+Per-upstream circuit breakers
+After BREAKER_FAILURE_THRESHOLD consecutive failures (connection errors,
+timeouts, 5xx) an upstream's breaker opens and calls to it fail at once with
+CircuitOpen, so callers go straight to their fallback data instead of each
+waiting out a timeout. After BREAKER_RESET_SECONDS one probe request is let
+through (half-open): success closes the breaker, failure opens it again.
+"""
+import os
+import time
+import threading
+from .metrics import metrics
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', 30))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_REJECTIONS = metrics.counter(
+    'circuit_breaker_rejections_total', 'Calls failed fast because the upstream breaker was open', ['upstream'])
+BREAKER_TRANSITIONS = metrics.counter(
+    'circuit_breaker_transitions_total', 'Breaker state changes by the state entered', ['upstream', 'state'])
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+        self._lock = threading.Lock()
+        self.stats = {'successes': 0, 'failures': 0, 'inconclusive': 0, 'rejected': 0, 'opened': 0}
+
+    def before_call(self):
+        """
+        Raise CircuitOpen unless a call may go out now
+        Returns True when the call is the half-open probe; pass it back to record().
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._enter(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self.probing:
+                # This call is the probe; everyone else keeps failing fast until it reports back
+                self.probing = True
+                return True
+            self.stats['rejected'] += 1
+            retry_in = max(self.reset_seconds - (time.monotonic() - self.opened_at), 0)
+        BREAKER_REJECTIONS.inc(upstream=self.name)
+        raise CircuitOpen(f"{self.name} circuit is open (retry in {retry_in:.0f}s)")
+
+    def record(self, success, probe=False):
+        """Report the outcome of a call let through by before_call()"""
+        with self._lock:
+            if probe:
+                self.probing = False
+            if success:
+                self.stats['successes'] += 1
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._enter(CLOSED)
+                return
+            self.stats['failures'] += 1
+            self.failures += 1
+            if probe or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.stats['opened'] += 1
+                self._enter(OPEN)
+
+    def release(self, probe=False):
+        """Report a call that ended without saying anything about the upstream's health"""
+        with self._lock:
+            self.stats['inconclusive'] += 1
+            if probe:
+                # Let the next call probe instead
+                self.probing = False
+
+    def _enter(self, state):
+        """Switch state (lock held)"""
+        if state != self.state:
+            print(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+            BREAKER_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, state=self.state, consecutive_failures=self.failures)
+
+
+class BreakerRegistry:
+    """One breaker per upstream, created on first use"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, upstream):
+        with self._lock:
+            breaker = self._breakers.get(upstream)
+            if breaker is None:
+                breaker = self._breakers[upstream] = CircuitBreaker(upstream)
+            return breaker
+
+    def get_stats(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.get_stats() for name, breaker in breakers.items()}
+
+
+# Global registry instance
+breakers = BreakerRegistry()
+
+metrics.gauge('circuit_breaker_state', 'Upstream breaker state (0 closed, 1 half-open, 2 open)', ['upstream'],
+              callback=lambda: [({'upstream': name}, STATE_VALUES[stats['state']])
+                                for name, stats in breakers.get_stats().items()])
@@ -0,0 +1,208 @@
+"""
+Process-wide registry of upstream clients and HTTP sessions
+Clients are stateless apart from config read at construction, so one instance
+of each is shared by every job. Each upstream gets one keep-alive
+requests.Session whose connection pool is reused across calls and jobs,
+instead of a new TCP+TLS handshake per request.
+"""
+import os
+import json
+import threading
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from .async_runtime import UPSTREAM_LIMITS
+from .metrics import metrics
+from .circuit_breaker import breakers
+from .deadline import bounded_by_deadline
+
+# Max keep-alive connections per host for each upstream session
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 32))
+# OpenAI gets a pool as large as the number of calls we allow in flight
+POOL_SIZES = {
+    'openai': int(os.environ.get('OPENAI_POOL_SIZE', UPSTREAM_LIMITS['openai']))
+}
+# Retries for connections that fail or get reset before a response arrives
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+# Upstreams whose POSTs are safe to resend after a reset (a repeat only costs tokens)
+RETRY_POST_UPSTREAMS = ('openai',)
+# Upstreams behind a circuit breaker. 'website' is left out: it is a different
+# site every job, so one brand's broken homepage says nothing about the next.
+BREAKER_UPSTREAMS = ('openai', 'foreplay', 'duckduckgo', 'coda')
+# Upstreams with one breaker per model (e.g. 'openai:gpt-5-mini'): one model's
+# outage must not cut off the fallback model served by the same host
+MODEL_BREAKER_UPSTREAMS = ('openai',)
+
+HTTP_RETRIES = metrics.counter(
+    'http_retries_total', 'Requests resent after a connection error or reset', ['upstream'])
+
+
+class ResetRetry(Retry):
+    """
+    urllib3 Retry for dropped or reset connections
+    Read timeouts are not retried: the call already used its whole timeout.
+    """
+
+    def __init__(self, *args, upstream=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upstream = upstream
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.upstream = self.upstream
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        HTTP_RETRIES.inc(upstream=self.upstream)
+        return retry
+
+
+class BreakerAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that sends through the upstream's circuit breaker
+    Connection errors, timeouts and 5xx responses count as failures; 4xx and
+    429 don't (the upstream is up, and 429s are handled by the rate limiter).
+    Neither do timeouts the job's deadline cut short: a job near its budget
+    sends short timeouts that a healthy upstream can miss.
+    With `per_model`, the breaker is picked by the `model` in the JSON body.
+    """
+
+    def __init__(self, upstream, *args, per_model=False, **kwargs):
+        self.upstream = upstream
+        self.per_model = per_model
+        super().__init__(*args, **kwargs)
+
+    def _breaker(self, request):
+        model = None
+        if self.per_model and request.body:
+            try:
+                model = json.loads(request.body).get('model')
+            except (TypeError, ValueError, AttributeError):
+                pass
+        return breakers.get(f'{self.upstream}:{model}' if model else self.upstream)
+
+    def send(self, request, **kwargs):
+        breaker = self._breaker(request)
+        probe = breaker.before_call()
+        deadline_bound = bounded_by_deadline(kwargs.get('timeout'))
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.Timeout:
+            if deadline_bound:
+                breaker.release(probe)
+            else:
+                breaker.record(False, probe)
+            raise
+        except BaseException:
+            breaker.record(False, probe)
+            raise
+        breaker.record(response.status_code < 500, probe)
+        return response
+
+
+class ClientRegistry:
+    """Lazily built, shared client instances and per-upstream sessions"""
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE):
+        self.pool_size = pool_size
+        self._clients = {}
+        self._sessions = {}
+        # Re-entrant: building a client may fetch the shared OpenAI client
+        self._lock = threading.RLock()
+
+    def get(self, cls):
+        """Return the shared instance of a client class, building it on first use"""
+        client = self._clients.get(cls)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(cls)
+                if client is None:
+                    client = self._clients[cls] = cls()
+        return client
+
+    def session(self, upstream):
+        """Return the pooled session for an upstream ('openai', 'foreplay', ...)"""
+        session = self._sessions.get(upstream)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(upstream)
+                if session is None:
+                    session = self._sessions[upstream] = self._build_session(upstream)
+        return session
+
+    def _build_session(self, upstream):
+        pool_size = POOL_SIZES.get(upstream, self.pool_size)
+        retry = ResetRetry(
+            total=HTTP_MAX_RETRIES, status=0, backoff_factor=0.1, raise_on_status=False,
+            allowed_methods=None if upstream in RETRY_POST_UPSTREAMS else Retry.DEFAULT_ALLOWED_METHODS,
+            upstream=upstream
+        )
+        session = requests.Session()
+        if upstream in BREAKER_UPSTREAMS:
+            adapter = BreakerAdapter(upstream, per_model=upstream in MODEL_BREAKER_UPSTREAMS,
+                                     pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        # Sessions are shared between jobs, so don't let cookies carry over
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def get_connection_stats(self):
+        """
+        Connections opened vs requests sent per upstream
+        `reused` counts requests that went over an already-open connection; under
+        steady load it should track `requests` while `connections_opened` stays flat.
+        """
+        with self._lock:
+            sessions = dict(self._sessions)
+        stats = {}
+        for upstream, session in sessions.items():
+            opened = sent = 0
+            for adapter in set(session.adapters.values()):
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+                        sent += pool.num_requests
+            stats[upstream] = {
+                'pool_size': POOL_SIZES.get(upstream, self.pool_size),
+                'connections_opened': opened,
+                'requests': sent,
+                'reused': max(sent - opened, 0)
+            }
+        return stats
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'clients': sorted(cls.__name__ for cls in self._clients),
+                'sessions': self.get_connection_stats()
+            }
+
+
+# Global registry instance
+clients = ClientRegistry()
+
+
+def get_session(upstream):
+    """Shortcut for clients.session()"""
+    return clients.session(upstream)
+
+
+def _connection_samples(field):
+    return lambda: [({'upstream': name}, stats[field]) for name, stats in clients.get_connection_stats().items()]
+
+
+metrics.gauge('http_connections_opened', 'New TCP+TLS connections opened per upstream session',
+              ['upstream'], callback=_connection_samples('connections_opened'))
+metrics.gauge('http_requests_sent', 'Requests sent per upstream session (including retries)',
+              ['upstream'], callback=_connection_samples('requests'))
+metrics.gauge('http_connections_reused', 'Requests sent over an already-open connection',
+              ['upstream'], callback=_connection_samples('reused'))
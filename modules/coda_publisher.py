@@ -1,8 +1,11 @@
 import os
-import requests
 import json
 from datetime import datetime
 from .error_logger import error_logger
+from .async_runtime import call_upstream
+from .metrics import track_upstream, UPSTREAM_ERRORS
+from .clients import get_session
+from .deadline import call_timeout
 
 class CodaPublisher:
     def __init__(self):
@@ -41,6 +44,10 @@ class CodaPublisher:
         except Exception as e:
             print(f"Coda publishing error: {e}")
             return self._get_mock_coda_url()
+
+    async def create_doc_async(self, brief):
+        """Async create_doc() bounded by the Coda concurrency limit"""
+        return await call_upstream('coda', self.create_doc, brief)
     
     def _format_brief_for_table(self, brief):
         """Format the brief data to match table columns"""
@@ -126,12 +133,15 @@ class CodaPublisher:
                 }]
             }
             
-            response = requests.post(url, json=payload, headers=self.headers)
+            timeout = call_timeout('coda', 30)
+            with track_upstream('coda', 'rows'):
+                response = get_session('coda').post(url, json=payload, headers=self.headers, timeout=timeout)
             
             if response.status_code in [200, 201, 202]:
                 print("Successfully added row to Coda table")
                 return True
             else:
+                UPSTREAM_ERRORS.inc(upstream='coda', endpoint='rows')
                 print(f"Error adding row: {response.status_code} - {response.text}")
                 return False
                 
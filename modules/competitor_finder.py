@@ -1,9 +1,14 @@
 import os
-import requests
 from urllib.parse import urlparse, quote
-import json
 from bs4 import BeautifulSoup
+import asyncio
 from .openai_helper import get_openai_client
+from .async_runtime import call_upstream
+from .metrics import track_upstream, UPSTREAM_ERRORS
+from .clients import get_session
+from .deadline import call_timeout
+from .schemas import response_format, parse_response
+from .tokens import fit_prompt, Section
 
 class CompetitorFinder:
     def __init__(self):
@@ -34,6 +39,28 @@ class CompetitorFinder:
         except Exception as e:
             print(f"Error finding competitors: {e}")
             return self._get_mock_competitors(brand_data)
+
+    async def find_async(self, brand_data):
+        """Async find(); both web searches run concurrently under the search limit"""
+        try:
+            queries = self._build_search_queries(brand_data)
+            batches = await asyncio.gather(*[
+                self._search_web_async(query, brand_data['url']) for query in queries[:2]
+            ])
+            search_results = [result for batch in batches for result in batch]
+
+            competitors = await call_upstream(
+                'openai', self._extract_competitors_from_search_results, brand_data, search_results
+            )
+
+            if competitors:
+                return competitors[:5]
+
+            return self._get_mock_competitors(brand_data)
+
+        except Exception as e:
+            print(f"Error finding competitors: {e}")
+            return self._get_mock_competitors(brand_data)
     
     def _build_search_queries(self, brand_data):
         """Build search queries to find competitors"""
@@ -57,6 +84,13 @@ class CompetitorFinder:
             return self._search_duckduckgo(query, exclude_url)
         else:
             return self._get_mock_search_results(query)
+
+    async def _search_web_async(self, query, exclude_url):
+        """Async _search_web()"""
+        if self.search_method == 'duckduckgo':
+            return await self._search_duckduckgo_async(query, exclude_url)
+        else:
+            return self._get_mock_search_results(query)
     
     def _search_duckduckgo(self, query, exclude_url):
         """Use DuckDuckGo instant answer API (free, no key needed!)"""
@@ -71,7 +105,9 @@ class CompetitorFinder:
             
             # Use DuckDuckGo HTML search
             search_url = f"https://html.duckduckgo.com/html/?q={quote(query)}"
-            response = requests.get(search_url, headers=headers, timeout=10)
+            timeout = call_timeout('duckduckgo', 10)
+            with track_upstream('duckduckgo', 'html_search'):
+                response = get_session('duckduckgo').get(search_url, headers=headers, timeout=timeout)
             
             if response.status_code == 200:
                 soup = BeautifulSoup(response.text, 'html.parser')
@@ -107,6 +143,8 @@ class CompetitorFinder:
                         
                     except Exception as e:
                         continue
+            else:
+                UPSTREAM_ERRORS.inc(upstream='duckduckgo', endpoint='html_search')
                 
         except Exception as e:
             print(f"DuckDuckGo search error: {e}")
@@ -114,6 +152,10 @@ class CompetitorFinder:
             return self._get_mock_search_results(query)
         
         return results[:5]  # Return top 5
+
+    async def _search_duckduckgo_async(self, query, exclude_url):
+        """Async _search_duckduckgo() bounded by the DuckDuckGo concurrency limit"""
+        return await call_upstream('duckduckgo', self._search_duckduckgo, query, exclude_url)
     
     def _get_mock_search_results(self, query):
         """Return mock search results for testing"""
@@ -194,29 +236,23 @@ class CompetitorFinder:
     def _extract_competitors_from_search_results(self, brand_data, search_results):
         """Use AI to analyze search results and extract actual competitor companies"""
         try:
-            # Compile search results into a text format for AI analysis
-            search_text = "Search results about competitors:\n\n"
-            for i, result in enumerate(search_results[:10], 1):
-                search_text += f"{i}. Title: {result.get('title', '')}\n"
-                search_text += f"   URL: {result.get('url', '')}\n"
-                search_text += f"   Description: {result.get('description', '')}\n\n"
-
-            prompt = f"""Analyze these search results about {brand_data.get('brand_name', 'a company')}'s competitors.
+            # Up to 10 search results, fewer if they don't fit the prompt budget (see modules/tokens.py)
+            prompt = fit_prompt('CompetitorFinder._extract_competitors_from_search_results', """Analyze these search results about {subject}'s competitors.
 
 Brand being analyzed:
-- Name: {brand_data.get('brand_name', 'Unknown')}
-- Industry: {brand_data.get('industry', 'Unknown')}
-- Niche: {brand_data.get('niche', 'Unknown')}
-- Website: {brand_data.get('url', '')}
+- Name: {brand_name}
+- Industry: {industry}
+- Niche: {niche}
+- Website: {url}
 
 Search Results:
 {search_text}
 
 Based on these search results, identify the TOP 5 ACTUAL COMPETITOR COMPANIES mentioned.
-These should be real companies that compete directly with {brand_data.get('brand_name', 'this brand')}.
+These should be real companies that compete directly with {this_brand}.
 
 DO NOT include:
-- The brand being analyzed ({brand_data.get('brand_name', '')})
+- The brand being analyzed ({excluded_brand})
 - Article websites (Forbes, TechCrunch, etc.)
 - Review sites (G2, Capterra, etc.)
 - Generic descriptors
@@ -227,30 +263,33 @@ Return exactly 5 real competitor companies in JSON format:
     "brand_name": "Company Name",
     "url": "https://www.companywebsite.com",
     "usp": "What makes them unique/competitive",
-    "why_competitor": "Why they compete with {brand_data.get('brand_name', 'this brand')}"
+    "why_competitor": "Why they compete with {this_brand}"
   }}
 ]
 
 If the search results mention specific companies as competitors, include those.
-For each company, provide their actual website URL if possible, otherwise use the format https://www.[companyname].com"""
+For each company, provide their actual website URL if possible, otherwise use the format https://www.[companyname].com""",
+                subject=brand_data.get('brand_name', 'a company'),
+                brand_name=brand_data.get('brand_name', 'Unknown'),
+                industry=brand_data.get('industry', 'Unknown'),
+                niche=brand_data.get('niche', 'Unknown'),
+                url=brand_data.get('url', ''),
+                this_brand=brand_data.get('brand_name', 'this brand'),
+                excluded_brand=brand_data.get('brand_name', ''),
+                search_text=Section(search_results[:10], minimum=3, render=_format_search_results))
 
             response = self.client.chat.completions.create(
-                model="gpt-5-mini",
                 messages=[
                     {"role": "system", "content": "You are an expert at analyzing search results to identify actual competitor companies. Extract only real company names mentioned in the search results. Always return valid JSON."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=1.0,
-                max_tokens=1500
+                max_tokens=1500,
+                call_site='CompetitorFinder._extract_competitors_from_search_results',
+                response_format=response_format('competitors')
             )
 
-            result = response.choices[0].message.content
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.endswith('```'):
-                result = result[:-3]
-
-            competitors_data = json.loads(result.strip())
+            competitors_data = parse_response('competitors', response.choices[0].message.content)
 
             # Format for our system
             formatted_competitors = []
@@ -337,4 +376,14 @@ For each company, provide their actual website URL if possible, otherwise use th
                 'funnel_type': 'direct_purchase',
                 'has_ads': True
             }
-        ]
\ No newline at end of file
+        ]
+
+
+def _format_search_results(results):
+    """Search results as numbered text for the competitor extraction prompt"""
+    search_text = "Search results about competitors:\n\n"
+    for i, result in enumerate(results, 1):
+        search_text += f"{i}. Title: {result.get('title', '')}\n"
+        search_text += f"   URL: {result.get('url', '')}\n"
+        search_text += f"   Description: {result.get('description', '')}\n\n"
+    return search_text
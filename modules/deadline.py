@@ -0,0 +1,73 @@
+"""
+Per-job deadline budget
+A job sets its deadline once and every upstream call sizes its timeout from
+the time left. When too little is left to be worth trying, the call raises
+DeadlineExceeded, which sends the stage down its existing fallback path, so a
+brief finishes close to its budget no matter how slow the upstreams are.
+The deadline lives in a contextvar, so it follows the job into stage threads
+and event-loop tasks.
+"""
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from .metrics import metrics
+
+# Default total budget for one brief; requests may ask for their own
+BRIEF_DEADLINE_SECONDS = float(os.environ.get('BRIEF_DEADLINE_SECONDS', 300))
+# Calls that would get less than this are skipped in favour of the fallback
+MIN_CALL_SECONDS = float(os.environ.get('DEADLINE_MIN_CALL_SECONDS', 2))
+
+DEADLINE_EXCEEDED = metrics.counter(
+    'deadline_exceeded_total', 'Upstream calls skipped because the job ran out of budget', ['upstream'])
+
+_deadline = contextvars.ContextVar('brief_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The job's deadline leaves no time for this call"""
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Run the with-block under a deadline `seconds` from now"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_timeout(upstream, default):
+    """Timeout for the next upstream call: `default`, capped by the time left"""
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_CALL_SECONDS:
+        DEADLINE_EXCEEDED.inc(upstream=upstream)
+        raise DeadlineExceeded(f"No time left for {upstream} call ({max(left, 0):.1f}s remaining)")
+    return min(default, left)
+
+
+def bounded_by_deadline(timeout):
+    """
+    Whether a call sent now with `timeout` would be cut off by the deadline first
+    True when call_timeout() capped the timeout to the time left, so a
+    timeout says more about the job's budget than about the upstream.
+    """
+    left = remaining()
+    if left is None or timeout is None:
+        return False
+    # (connect, read) tuples: a slow upstream shows up as a read timeout
+    if isinstance(timeout, tuple):
+        timeout = timeout[-1]
+    # Some slack for the time spent between call_timeout() and the send
+    return left <= timeout + 1
@@ -0,0 +1,64 @@
+"""
+Diversity-aware selection of generated ad concepts
+Candidates are embedded locally with TF-IDF over character n-grams (no API
+call) and picked by maximal marginal relevance: each pick is the candidate
+closest to the brief's context after a penalty for resembling the ones
+already chosen, so near-duplicate headlines don't both make the cut.
+"""
+import os
+import re
+from collections import Counter
+import numpy as np
+
+NGRAM_SIZES = (3, 4, 5)
+# 0 picks on relevance alone, 1 on novelty alone
+CONCEPT_DIVERSITY = float(os.environ.get('AI_CONCEPT_DIVERSITY', 0.5))
+
+
+def _char_ngrams(text):
+    text = ' ' + re.sub(r'\s+', ' ', text.lower()).strip() + ' '
+    return Counter(text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1))
+
+
+def tfidf_matrix(texts):
+    """One L2-normalised TF-IDF row per text, over character n-grams"""
+    vocab = {}
+    rows, cols, counts = [], [], []
+    for row, text in enumerate(texts):
+        for gram, count in _char_ngrams(text).items():
+            rows.append(row)
+            cols.append(vocab.setdefault(gram, len(vocab)))
+            counts.append(count)
+    tf = np.zeros((len(texts), max(len(vocab), 1)))
+    tf[rows, cols] = counts
+    tf = np.log1p(tf)
+    df = np.count_nonzero(tf, axis=0)
+    matrix = tf * (np.log((1 + len(texts)) / (1 + df)) + 1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(vectors, relevance, k, diversity=CONCEPT_DIVERSITY):
+    """Indices of k rows chosen by maximal marginal relevance, in pick order"""
+    similarity = vectors @ vectors.T
+    available = np.ones(len(vectors), dtype=bool)
+    redundancy = np.zeros(len(vectors))
+    selected = []
+    for _ in range(min(k, len(vectors))):
+        scores = (1 - diversity) * relevance - diversity * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        redundancy = np.maximum(redundancy, similarity[:, pick])
+    return selected
+
+
+def select_diverse(texts, query, k, diversity=CONCEPT_DIVERSITY):
+    """
+    Pick k of `texts` that are relevant to `query` and unlike each other
+    Returns indices into `texts`, best first.
+    """
+    vectors = tfidf_matrix(list(texts) + [query])
+    candidates, query_vector = vectors[:-1], vectors[-1]
+    return mmr_select(candidates, candidates @ query_vector, k, diversity)
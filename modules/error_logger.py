@@ -6,6 +6,7 @@ import json
 from datetime import datetime
 import traceback
 import requests
+from .metrics import ERRORS_TOTAL
 
 class ErrorLogger:
     def __init__(self):
@@ -26,6 +27,7 @@ class ErrorLogger:
         }
         
         self.errors.append(error_data)
+        ERRORS_TOTAL.inc(module=module)
         
         # Print to console for Render logs
         print(f"ERROR in {module}: {error}")
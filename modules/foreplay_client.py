@@ -1,7 +1,12 @@
 import os
-import requests
 import json
 from datetime import datetime, timedelta
+import asyncio
+from .async_runtime import call_upstream
+from .metrics import track_upstream, UPSTREAM_ERRORS
+from .clients import get_session
+from .deadline import call_timeout
+from .ad_patterns import advertiser_ads
 
 class ForeplayClient:
     def __init__(self):
@@ -17,8 +22,29 @@ class ForeplayClient:
         else:
             print("Foreplay: No API key found in environment")
 
-    def get_top_advertisers(self, keywords, competitors):
-        """Get top 3 Meta advertisers in the niche"""
+    def search_keyword_ads(self, keywords, shared=None):
+        """
+        Search raw ads for the top keywords (needs no competitor data)
+        With a SharedWork `shared`, each keyword is only searched once per batch.
+        """
+        if not self.api_key:
+            return []
+
+        all_ads = []
+        for keyword in keywords[:2]:  # Limit to save API credits
+            if shared is not None:
+                ads = shared.get_or_compute(self._keyword_key(keyword), self._search_ads_by_keyword, keyword)
+            else:
+                ads = self._search_ads_by_keyword(keyword)
+            all_ads.extend(ads)
+        return all_ads
+
+    def get_top_advertisers(self, keywords, competitors, keyword_ads=None):
+        """
+        Get top 3 Meta advertisers in the niche
+        Pass `keyword_ads` from search_keyword_ads() when the keyword search
+        already ran, so only the competitor lookup is left to do here.
+        """
         try:
             if not self.api_key:
                 print("Foreplay: No API key found, using mock data")
@@ -27,12 +53,10 @@ class ForeplayClient:
             print(f"Foreplay: API key found, fetching real ads")
             print(f"Foreplay: Keywords: {keywords[:3]}")
 
-            all_ads = []
-
             # Search ads by keywords
-            for keyword in keywords[:2]:  # Limit to save API credits
-                ads = self._search_ads_by_keyword(keyword)
-                all_ads.extend(ads)
+            if keyword_ads is None:
+                keyword_ads = self.search_keyword_ads(keywords)
+            all_ads = list(keyword_ads)
 
             # Search by competitor domains if we have them
             for comp in competitors[:1]:  # Check top competitor
@@ -51,6 +75,50 @@ class ForeplayClient:
             print(f"Foreplay: Falling back to mock data due to error")
             return self._get_mock_advertisers(keywords)
 
+    async def search_keyword_ads_async(self, keywords, shared=None):
+        """Async search_keyword_ads(); keyword searches run concurrently under the Foreplay limit"""
+        if not self.api_key:
+            return []
+
+        def search(keyword):
+            if shared is not None:
+                return shared.get_or_compute_async(
+                    self._keyword_key(keyword), call_upstream, 'foreplay', self._search_ads_by_keyword, keyword
+                )
+            return call_upstream('foreplay', self._search_ads_by_keyword, keyword)
+
+        batches = await asyncio.gather(*[search(keyword) for keyword in keywords[:2]])
+        return [ad for batch in batches for ad in batch]
+
+    def _keyword_key(self, keyword):
+        """SharedWork key for a keyword search"""
+        return ('foreplay_keyword', keyword.strip().lower())
+
+    async def get_top_advertisers_async(self, keywords, competitors, keyword_ads=None):
+        """Async get_top_advertisers()"""
+        try:
+            if not self.api_key:
+                print("Foreplay: No API key found, using mock data")
+                return self._get_mock_advertisers(keywords)
+
+            if keyword_ads is None:
+                keyword_ads = await self.search_keyword_ads_async(keywords)
+            all_ads = list(keyword_ads)
+
+            for comp in competitors[:1]:  # Check top competitor
+                domain = self._extract_domain(comp.get('url', ''))
+                if domain:
+                    brands = await call_upstream('foreplay', self._search_brands_by_domain, domain)
+                    for brand in brands:
+                        all_ads.extend(self._get_brand_ads(brand))
+
+            return self._process_ads_to_advertisers(all_ads)
+
+        except Exception as e:
+            print(f"Foreplay API error: {e}")
+            print(f"Foreplay: Falling back to mock data due to error")
+            return self._get_mock_advertisers(keywords)
+
     def _search_ads_by_keyword(self, keyword):
         """Search ads by keyword via Foreplay API"""
         try:
@@ -65,7 +133,9 @@ class ForeplayClient:
             }
 
             print(f"Foreplay: Searching ads for keyword '{keyword}'")
-            response = requests.get(url, params=params, headers=self.headers, timeout=10)
+            timeout = call_timeout('foreplay', 10)
+            with track_upstream('foreplay', 'discovery/ads'):
+                response = get_session('foreplay').get(url, params=params, headers=self.headers, timeout=timeout)
 
             print(f"Foreplay: Response status: {response.status_code}")
             if response.status_code == 200:
@@ -74,6 +144,7 @@ class ForeplayClient:
                 print(f"Foreplay: Found {len(ads)} ads for '{keyword}'")
                 return ads
             else:
+                UPSTREAM_ERRORS.inc(upstream='foreplay', endpoint='discovery/ads')
                 print(f"Foreplay: API error: {response.status_code} - {response.text[:200]}")
 
         except Exception as e:
@@ -91,7 +162,9 @@ class ForeplayClient:
             }
 
             print(f"Foreplay: Searching brands for domain '{domain}'")
-            response = requests.get(url, params=params, headers=self.headers, timeout=10)
+            timeout = call_timeout('foreplay', 10)
+            with track_upstream('foreplay', 'brand/getBrandsByDomain'):
+                response = get_session('foreplay').get(url, params=params, headers=self.headers, timeout=timeout)
 
             if response.status_code == 200:
                 data = response.json()
@@ -99,6 +172,7 @@ class ForeplayClient:
                 print(f"Foreplay: Found {len(brands)} brands for domain '{domain}'")
                 return brands
             else:
+                UPSTREAM_ERRORS.inc(upstream='foreplay', endpoint='brand/getBrandsByDomain')
                 print(f"Foreplay: Domain search error: {response.status_code}")
 
         except Exception as e:
@@ -127,7 +201,7 @@ class ForeplayClient:
 
         for ad in all_ads:
             # Extract advertiser info from ad
-            advertiser_name = ad.get('advertiser_name') or ad.get('page_name') or 'Unknown Advertiser'
+            advertiser_name = self._advertiser_name(ad)
 
             if advertiser_name not in advertisers_map:
                 advertisers_map[advertiser_name] = {
@@ -140,17 +214,7 @@ class ForeplayClient:
                 }
 
             # Add this ad to the advertiser's collection
-            ad_data = {
-                'ad_id': ad.get('id', ''),
-                'headline': ad.get('ad_creative_bodies', [''])[0] if ad.get('ad_creative_bodies') else '',
-                'body': ad.get('ad_creative_link_descriptions', [''])[0] if ad.get('ad_creative_link_descriptions') else '',
-                'cta': ad.get('cta_type', 'Learn More'),
-                'days_running': ad.get('days_running', 0),
-                'image_url': ad.get('asset_url', ''),
-                'link': ad.get('link_url', '')
-            }
-
-            advertisers_map[advertiser_name]['top_ads'].append(ad_data)
+            advertisers_map[advertiser_name]['top_ads'].append(self._normalize_ad(ad))
             advertisers_map[advertiser_name]['score'] += 10  # Increment score per ad
 
         # Convert to list and sort by score
@@ -163,6 +227,36 @@ class ForeplayClient:
 
         return advertisers[:3]
 
+    def _advertiser_name(self, ad):
+        return ad.get('advertiser_name') or ad.get('page_name') or 'Unknown Advertiser'
+
+    def _normalize_ad(self, ad):
+        """Top-ad fields of a raw Foreplay ad"""
+        return {
+            'ad_id': ad.get('id', ''),
+            'headline': ad.get('ad_creative_bodies', [''])[0] if ad.get('ad_creative_bodies') else '',
+            'body': ad.get('ad_creative_link_descriptions', [''])[0] if ad.get('ad_creative_link_descriptions') else '',
+            'cta': ad.get('cta_type', 'Learn More'),
+            'days_running': ad.get('days_running', 0),
+            'image_url': ad.get('asset_url', ''),
+            'link': ad.get('link_url', '')
+        }
+
+    def collect_ads(self, keyword_ads, advertisers):
+        """
+        Every fetched ad in top-ad form, each once
+        Covers all keyword search results, not just the 3 advertisers x 3 ads
+        kept by get_top_advertisers(), plus those advertisers' ads (mock data
+        when there is no API key).
+        """
+        ads = [dict(self._normalize_ad(ad), advertiser_name=self._advertiser_name(ad)) for ad in keyword_ads]
+        ads += advertiser_ads(advertisers)
+        unique = {}
+        for ad in ads:
+            key = ad.get('ad_id') or (ad['advertiser_name'], ad.get('headline'), ad.get('body'))
+            unique.setdefault(key, ad)
+        return list(unique.values())
+
     def _rank_advertisers(self, advertisers):
         """Rank advertisers by longevity and volume"""
         # Score based on days running and number of ads
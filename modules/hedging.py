@@ -0,0 +1,143 @@
+"""
+Latency hedging for LLM calls
+Keeps a window of recent latencies per call site. When a call that opted in
+runs past the configured percentile of that window, a duplicate request is
+sent and whichever finishes first is used. Hedges are paid for from a budget
+that grows by OPENAI_HEDGE_MAX_RATIO per call, so extra spend stays capped at
+that fraction of requests however slow the API gets.
+"""
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from .metrics import metrics, InstrumentedThreadPool
+
+# Hedge once a call is slower than this percentile of recent calls (0 disables hedging)
+HEDGE_PERCENTILE = float(os.environ.get('OPENAI_HEDGE_PERCENTILE', 95))
+# Extra requests allowed, as a fraction of all hedgeable calls
+HEDGE_MAX_RATIO = float(os.environ.get('OPENAI_HEDGE_MAX_RATIO', 0.05))
+HEDGE_BURST = 5
+# Samples needed before a call site's percentile is trusted
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+HEDGES = metrics.counter(
+    'openai_hedges_total', 'Duplicate requests sent for slow calls, by which copy won', ['call_site', 'winner'])
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per key"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key, percentile, min_samples=HEDGE_MIN_SAMPLES):
+        """The given percentile of the window, or None with too few samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        index = min(int(len(samples) * percentile / 100), len(samples) - 1)
+        return samples[index]
+
+    def get_stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            key: {
+                'samples': len(self._samples[key]),
+                'p50': self.percentile(key, 50, 1),
+                'p95': self.percentile(key, 95, 1),
+                'p99': self.percentile(key, 99, 1)
+            }
+            for key in keys
+        }
+
+
+class Hedger:
+    """Runs a call, racing a duplicate against it when it is slower than usual"""
+
+    def __init__(self, pool, percentile=HEDGE_PERCENTILE, max_ratio=HEDGE_MAX_RATIO):
+        self.pool = pool
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.latencies = LatencyTracker()
+        self.credit = HEDGE_BURST
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'hedged': 0, 'backup_won': 0, 'skipped_for_budget': 0}
+
+    def _spend(self):
+        """Take one hedge from the budget if there is one"""
+        with self._lock:
+            if self.credit >= 1:
+                self.credit -= 1
+                self.stats['hedged'] += 1
+                return True
+            self.stats['skipped_for_budget'] += 1
+            return False
+
+    def run(self, key, start, discard=None):
+        """
+        Return start(), hedged with a second start() past the key's latency percentile
+        `discard(result)` is called on the losing copy's result (e.g. to close a stream).
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+            self.credit = min(HEDGE_BURST, self.credit + self.max_ratio)
+        threshold = self.latencies.percentile(key, self.percentile) if self.percentile > 0 else None
+
+        began = time.monotonic()
+        if threshold is None:
+            result = start()
+            self.latencies.record(key, time.monotonic() - began)
+            return result
+
+        def timed():
+            result = start()
+            self.latencies.record(key, time.monotonic() - began)
+            return result
+
+        primary = self.pool.submit(contextvars.copy_context().run, timed)
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._spend():
+            return primary.result()
+
+        backup = self.pool.submit(contextvars.copy_context().run, start)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                winner = 'primary' if future is primary else 'backup'
+                HEDGES.inc(call_site=key, winner=winner)
+                if winner == 'backup':
+                    with self._lock:
+                        self.stats['backup_won'] += 1
+                if discard:
+                    for other in (primary, backup):
+                        if other is not future:
+                            other.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                return future.result()
+        raise error
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, credit=round(self.credit, 2), percentile=self.percentile)
+        stats['latency'] = self.latencies.get_stats()
+        return stats
+
+
+# Hedged calls run on their own pool so they never wait behind the requests they hedge
+hedge_pool = InstrumentedThreadPool('openai_hedge', max_workers=int(os.environ.get('OPENAI_HEDGE_WORKERS', 64)))
+hedger = Hedger(hedge_pool)
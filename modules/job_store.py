@@ -0,0 +1,357 @@
+"""
+Job status storage
+The SQLite backend is shared by every gunicorn worker on the host and survives
+restarts; the memory backend keeps the original single-process behaviour.
+Jobs untouched for JOB_TTL_SECONDS (finished, or orphaned by a dead worker)
+are evicted so storage stays flat.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from .deadline import BRIEF_DEADLINE_SECONDS
+
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 24 * 3600))
+# How often waiters re-read the store to catch updates written by other workers
+STORE_POLL_INTERVAL = float(os.environ.get('JOB_STORE_POLL_INTERVAL', 0.5))
+FINISHED_STATUSES = ('completed', 'failed')
+# A processing job silent for longer than its deadline plus this grace lost its worker
+STALE_JOB_GRACE_SECONDS = int(os.environ.get('STALE_JOB_GRACE_SECONDS', 120))
+STALE_JOB_ERROR = 'Job stopped responding (its worker was restarted); resume it to continue'
+
+# Fields stored in their own columns; anything else goes into the `extra` JSON blob
+JOB_COLUMNS = ('status', 'progress', 'message', 'result', 'error', 'started_at')
+
+
+class JobStore:
+    """Interface shared by the job store backends"""
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._last_eviction = 0
+        self._changed = threading.Condition()
+
+    def create(self, job_id, record):
+        """Insert a new job record"""
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """Return the job record as a dict, or None"""
+        raise NotImplementedError
+
+    def update(self, job_id, expected_status=None, **fields):
+        """
+        Atomically update some fields of a job
+        With `expected_status`, the update only applies if the job currently has
+        that status. Returns whether a job was updated.
+        """
+        raise NotImplementedError
+
+    def delete(self, job_id):
+        """Remove a job record"""
+        raise NotImplementedError
+
+    def claim_key(self, key, job_id, window=None):
+        """
+        Atomically bind `key` to `job_id` unless another live job already owns it
+        Returns the owning job id. With a `window` (seconds), the current owner
+        only counts while it is processing or completed within the window;
+        without one, it counts for as long as its record exists. A stale
+        processing owner never counts: it loses the key and is marked failed.
+        """
+        raise NotImplementedError
+
+    def save_checkpoint(self, job_id, stage, outputs):
+        """Persist one finished stage's outputs so a failed job can resume after it"""
+        raise NotImplementedError
+
+    def load_checkpoints(self, job_id):
+        """Return {stage: outputs} for every checkpointed stage of a job"""
+        raise NotImplementedError
+
+    def evict_expired(self):
+        """Delete jobs not updated within the TTL; returns how many were removed"""
+        raise NotImplementedError
+
+    def is_stale(self, job):
+        """Processing, but quiet for longer than its deadline allows: the worker running it is gone"""
+        if job is None or job['status'] != 'processing' or job.get('type') == 'batch':
+            return False
+        limit = (job.get('deadline_seconds') or BRIEF_DEADLINE_SECONDS) + STALE_JOB_GRACE_SECONDS
+        return job['updated_at'] < time.time() - limit
+
+    def fail_if_stale(self, job_id, job=None):
+        """Mark an orphaned job failed so it can be resumed; returns the current record"""
+        if job is None:
+            job = self.get(job_id)
+        if self.is_stale(job) and self.update(job_id, expected_status='processing', status='failed',
+                                               error=STALE_JOB_ERROR, message='Job stopped responding'):
+            return self.get(job_id)
+        return job
+
+    def _owns_key(self, job, window):
+        if job is None or self.is_stale(job):
+            return False
+        if window is None or job['status'] == 'processing':
+            return True
+        return job['status'] == 'completed' and (job['finished_at'] or 0) >= time.time() - window
+
+    def wait_for_update(self, job_id, since, timeout=15):
+        """
+        Block until the job's updated_at moves past `since`, or until timeout
+        Updates made in this process wake waiters immediately; updates from
+        other workers are picked up by re-reading every STORE_POLL_INTERVAL.
+        Returns the current job record (None if it no longer exists).
+        """
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.time()
+            if job is None or job['updated_at'] > since or remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait(min(remaining, STORE_POLL_INTERVAL))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _maybe_evict(self):
+        """Run eviction at most once a minute, piggybacking on writes"""
+        now = time.time()
+        if now - self._last_eviction > 60:
+            self._last_eviction = now
+            self.evict_expired()
+
+
+class MemoryJobStore(JobStore):
+    """Process-local dict store (single worker only)"""
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        super().__init__(ttl)
+        self.jobs = {}
+        self.keys = {}
+        self.checkpoints = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, record):
+        with self._lock:
+            self.jobs[job_id] = dict(record, updated_at=time.time(), finished_at=None)
+        self._maybe_evict()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, expected_status=None, **fields):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or (expected_status and job['status'] != expected_status):
+                return False
+            job.update(fields)
+            job['updated_at'] = time.time()
+            if fields.get('status') in FINISHED_STATUSES:
+                job['finished_at'] = job['updated_at']
+        self._notify()
+        return True
+
+    def delete(self, job_id):
+        with self._lock:
+            self.jobs.pop(job_id, None)
+            self.checkpoints.pop(job_id, None)
+
+    def claim_key(self, key, job_id, window=None):
+        with self._lock:
+            owner = self.keys.get(key)
+            if owner is not None and self._owns_key(self.jobs.get(owner), window):
+                return owner
+            self.keys[key] = job_id
+        if owner is not None:
+            self.fail_if_stale(owner)
+        return job_id
+
+    def save_checkpoint(self, job_id, stage, outputs):
+        # Round-trip through JSON so the memory store behaves like the SQLite one
+        with self._lock:
+            self.checkpoints.setdefault(job_id, {})[stage] = json.loads(json.dumps(outputs))
+
+    def load_checkpoints(self, job_id):
+        with self._lock:
+            return json.loads(json.dumps(self.checkpoints.get(job_id, {})))
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job['updated_at'] < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+                self.checkpoints.pop(job_id, None)
+            self.keys = {key: job_id for key, job_id in self.keys.items() if job_id in self.jobs}
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """Local SQLite store shared across worker processes"""
+
+    def __init__(self, path, ttl=JOB_TTL_SECONDS):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        """One connection per thread; WAL lets readers and the writer overlap"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                result TEXT,
+                error TEXT,
+                started_at TEXT,
+                extra TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at);
+            CREATE TABLE IF NOT EXISTS job_keys (
+                key TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                outputs TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, stage)
+            );
+        ''')
+
+    def create(self, job_id, record):
+        columns = {key: record.get(key) for key in JOB_COLUMNS}
+        extra = {key: value for key, value in record.items() if key not in JOB_COLUMNS}
+        self._connect().execute(
+            'INSERT INTO jobs (job_id, status, progress, message, result, error, started_at, extra, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, columns['status'], columns['progress'] or 0, columns['message'],
+             json.dumps(columns['result']), columns['error'], columns['started_at'],
+             json.dumps(extra), time.time())
+        )
+        self._maybe_evict()
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row['extra'])
+        job.update({
+            'status': row['status'],
+            'progress': row['progress'],
+            'message': row['message'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'started_at': row['started_at'],
+            'updated_at': row['updated_at'],
+            'finished_at': row['finished_at']
+        })
+        return job
+
+    def update(self, job_id, expected_status=None, **fields):
+        now = time.time()
+        assignments = ['updated_at = ?']
+        params = [now]
+        for key in JOB_COLUMNS:
+            if key in fields:
+                assignments.append(f'{key} = ?')
+                params.append(json.dumps(fields[key]) if key == 'result' else fields[key])
+        if fields.get('status') in FINISHED_STATUSES:
+            assignments.append('finished_at = ?')
+            params.append(now)
+
+        extra = {key: value for key, value in fields.items() if key not in JOB_COLUMNS}
+        if extra:
+            # json_patch merges the new keys into the blob inside the same UPDATE
+            # (RFC 7396 semantics: a None value removes the key)
+            assignments.append('extra = json_patch(extra, ?)')
+            params.append(json.dumps(extra))
+
+        where = 'job_id = ?'
+        params.append(job_id)
+        if expected_status:
+            where += ' AND status = ?'
+            params.append(expected_status)
+
+        cursor = self._connect().execute(f'UPDATE jobs SET {", ".join(assignments)} WHERE {where}', params)
+        self._notify()
+        return cursor.rowcount > 0
+
+    def delete(self, job_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+        conn.execute('DELETE FROM checkpoints WHERE job_id = ?', (job_id,))
+
+    def claim_key(self, key, job_id, window=None):
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front so two workers can't both claim
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT job_id FROM job_keys WHERE key = ?', (key,)).fetchone()
+            previous = row['job_id'] if row is not None else None
+            if previous is not None and self._owns_key(self.get(previous), window):
+                owner = row['job_id']
+            else:
+                conn.execute(
+                    'INSERT OR REPLACE INTO job_keys (key, job_id, created_at) VALUES (?, ?, ?)',
+                    (key, job_id, time.time())
+                )
+                owner = job_id
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if previous is not None and owner == job_id:
+            self.fail_if_stale(previous)
+        return owner
+
+    def save_checkpoint(self, job_id, stage, outputs):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO checkpoints (job_id, stage, outputs, created_at) VALUES (?, ?, ?, ?)',
+            (job_id, stage, json.dumps(outputs), time.time())
+        )
+
+    def load_checkpoints(self, job_id):
+        rows = self._connect().execute(
+            'SELECT stage, outputs FROM checkpoints WHERE job_id = ?', (job_id,)
+        ).fetchall()
+        return {row['stage']: json.loads(row['outputs']) for row in rows}
+
+    def evict_expired(self):
+        conn = self._connect()
+        cursor = conn.execute(
+            'DELETE FROM jobs WHERE updated_at < ?',
+            (time.time() - self.ttl,)
+        )
+        conn.execute('DELETE FROM job_keys WHERE job_id NOT IN (SELECT job_id FROM jobs)')
+        conn.execute('DELETE FROM checkpoints WHERE job_id NOT IN (SELECT job_id FROM jobs)')
+        return cursor.rowcount
+
+
+def create_job_store():
+    """Build the store selected by JOB_STORE ('sqlite' or 'memory')"""
+    if os.environ.get('JOB_STORE', 'sqlite') == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(os.environ.get('JOB_DB_PATH', 'jobs.db'))
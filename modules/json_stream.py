@@ -0,0 +1,77 @@
+"""
+Incremental JSON array parser for streamed completions
+Feeds on text chunks as they arrive and hands back each element of the first
+top-level JSON array as soon as its closing bracket/brace is seen, so callers
+can use the first ad concept while the model is still writing the rest.
+Anything before the array (```json fences, preamble) is skipped.
+"""
+import json
+
+
+class JSONArrayStream:
+    """Scanner that tracks string/escape state and nesting depth across chunks"""
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+        self.done = False
+
+    def feed(self, text):
+        """Add a chunk and return the array elements completed by it"""
+        items = []
+        self.buffer += text
+        while self.pos < len(self.buffer) and not self.done:
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif self.depth == 0:
+                if char == '[':
+                    self.depth = 1
+            elif char == '"':
+                self.in_string = True
+                self._mark_start()
+            elif char in '[{':
+                self._mark_start()
+                self.depth += 1
+            elif char in ']}':
+                self.depth -= 1
+                if self.depth == 1 and self.item_start is not None:
+                    items.append(self._take(self.pos + 1))
+                elif self.depth == 0:
+                    # End of the array; a trailing scalar element may still be open
+                    if self.item_start is not None:
+                        items.append(self._take(self.pos))
+                    self.done = True
+            elif self.depth == 1:
+                if char == ',':
+                    if self.item_start is not None:
+                        items.append(self._take(self.pos))
+                elif not char.isspace():
+                    self._mark_start()
+            self.pos += 1
+        return [item for item in items if item is not _INVALID]
+
+    def _mark_start(self):
+        if self.depth == 1 and self.item_start is None:
+            self.item_start = self.pos
+
+    def _take(self, end):
+        """Parse buffer[item_start:end] as one element"""
+        text = self.buffer[self.item_start:end].strip()
+        self.item_start = None
+        try:
+            return json.loads(text)
+        except ValueError:
+            return _INVALID
+
+
+_INVALID = object()
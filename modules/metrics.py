@@ -0,0 +1,256 @@
+"""
+Prometheus-style metrics
+Counters, gauges and latency histograms kept in process memory and rendered in
+the Prometheus text format by the /metrics endpoint. Each gunicorn worker keeps
+its own numbers, like the default prometheus_client setup.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Upstream calls range from ~100ms (Foreplay) to a minute (GPT-5), so the
+# buckets are spread wide
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named family of labelled series"""
+
+    type = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        return [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or be computed at scrape time"""
+
+    type = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+        # callback() returns a list of (labels_dict, value) read at scrape time
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        if self.callback:
+            items += [(self._key(labels), value) for labels, value in self.callback()]
+        return [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in items]
+
+
+class Histogram(Metric):
+    """Cumulative-bucket latency histogram"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            items = [(key, dict(series, counts=list(series['counts']))) for key, series in self.series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series['counts']):
+                labels = key + (('le', _format_value(bound)),)
+                lines.append(f'{self.name}_bucket{_format_labels(labels)} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(series["sum"])}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {series["count"]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders the /metrics payload"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), callback=None):
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry instance
+metrics = MetricsRegistry()
+
+STAGE_LATENCY = metrics.histogram(
+    'brief_stage_duration_seconds', 'Duration of each process_brief stage', ['stage'])
+JOB_LATENCY = metrics.histogram(
+    'brief_job_duration_seconds', 'End-to-end duration of brief jobs', ['status'])
+JOBS_TOTAL = metrics.counter(
+    'brief_jobs_total', 'Finished brief jobs', ['status'])
+JOBS_IN_FLIGHT = metrics.gauge(
+    'brief_jobs_in_flight', 'Brief jobs currently running in this process')
+UPSTREAM_LATENCY = metrics.histogram(
+    'upstream_request_duration_seconds', 'Latency of upstream API calls', ['upstream', 'endpoint'])
+UPSTREAM_ERRORS = metrics.counter(
+    'upstream_errors_total', 'Upstream calls that raised or returned an error status', ['upstream', 'endpoint'])
+CACHE_REQUESTS = metrics.counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+ERRORS_TOTAL = metrics.counter(
+    'errors_total', 'Errors recorded by error_logger', ['module'])
+
+
+@contextmanager
+def track_upstream(upstream, endpoint):
+    """Time an upstream call; an exception escaping the block counts as an error"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream=upstream, endpoint=endpoint)
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - start, upstream=upstream, endpoint=endpoint)
+
+
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor that exports its in-flight, queued and max worker counts"""
+
+    pools = []
+
+    def __init__(self, name, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.size = max_workers
+        self.tasks = 0
+        self._count_lock = threading.Lock()
+        InstrumentedThreadPool.pools.append(self)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._count_lock:
+            self.tasks += 1
+        future = super().submit(fn, *args, **kwargs)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._count_lock:
+            self.tasks -= 1
+
+    def get_stats(self):
+        tasks = self.tasks
+        return {
+            'max_workers': self.size,
+            'active': min(tasks, self.size),
+            'queued': max(tasks - self.size, 0)
+        }
+
+
+def _pool_samples(field):
+    return lambda: [({'pool': pool.name}, pool.get_stats()[field]) for pool in InstrumentedThreadPool.pools]
+
+
+metrics.gauge('executor_max_workers', 'Thread pool size', ['pool'], callback=_pool_samples('max_workers'))
+metrics.gauge('executor_active_workers', 'Threads busy running tasks', ['pool'], callback=_pool_samples('active'))
+metrics.gauge('executor_queue_depth', 'Tasks waiting for a free thread', ['pool'], callback=_pool_samples('queued'))
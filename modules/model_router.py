@@ -0,0 +1,140 @@
+"""
+Model routing per call site
+Each call site that doesn't name a model gets one from ROUTES: a primary
+model and reasoning effort, a request timeout, and a fallback model. If the
+primary errors out, times out or stays rate-limited, the call is repeated
+once on the fallback, unless the job's deadline has run out. Simple extraction goes to gpt-5-nano; the fallback is
+a non-reasoning model with its own rate limits.
+Routes can be overridden with MODEL_ROUTES, a JSON object of
+call_site -> fields, e.g. {"AIEngine._generate_concepts": {"model": "gpt-5"}}.
+"""
+import os
+import json
+import time
+import threading
+from .metrics import metrics
+from .deadline import DeadlineExceeded
+
+ROUTE_LATENCY = metrics.histogram(
+    'llm_route_latency_seconds', 'OpenAI call latency by call site, model and outcome (ok/error)',
+    ['call_site', 'model', 'outcome'], buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90))
+ROUTE_FALLBACKS = metrics.counter(
+    'llm_route_fallbacks_total', 'Calls that moved to the fallback model after the primary failed', ['call_site'])
+
+
+class Route:
+    """Primary model settings for a call site, plus the model to fall back to"""
+
+    def __init__(self, model, reasoning_effort=None, fallback=None, timeout=60, primary_retries=1):
+        self.model = model
+        self.reasoning_effort = reasoning_effort
+        self.fallback = fallback
+        self.timeout = timeout
+        # Retries on the primary before falling back (429/5xx); the fallback gets the usual count
+        self.primary_retries = primary_retries if fallback else None
+
+    def primary_kwargs(self):
+        kwargs = {'model': self.model, 'timeout': self.timeout, 'max_retries': self.primary_retries}
+        if self.reasoning_effort and self.model.startswith('gpt-5'):
+            kwargs['reasoning_effort'] = self.reasoning_effort
+        return kwargs
+
+    def fallback_kwargs(self):
+        return {'model': self.fallback, 'timeout': self.timeout}
+
+    def describe(self):
+        return {
+            'model': self.model,
+            'reasoning_effort': self.reasoning_effort,
+            'fallback': self.fallback,
+            'timeout': self.timeout
+        }
+
+
+ROUTES = {
+    'BrandAnalyzer._ai_analyze': Route('gpt-5-nano', 'minimal', fallback='gpt-4.1-mini', timeout=30),
+    'CompetitorFinder._extract_competitors_from_search_results':
+        Route('gpt-5-nano', 'minimal', fallback='gpt-4.1-mini', timeout=30),
+    'RedditMiner.mine_problems': Route('gpt-5-mini', 'low', fallback='gpt-4.1-mini', timeout=45),
+    'RedditMiner._generate_structured_pain_points': Route('gpt-5-nano', 'minimal', fallback='gpt-4.1-mini', timeout=30),
+    'AIEngine._analyze_trends': Route('gpt-5-mini', 'low', fallback='gpt-4.1-mini', timeout=45),
+    'AIEngine._find_opportunities': Route('gpt-5-mini', 'low', fallback='gpt-4.1-mini', timeout=45),
+    'AIEngine._generate_concepts': Route('gpt-5-mini', 'low', fallback='gpt-4.1-mini', timeout=60),
+    'AIEngine._generate_fused': Route('gpt-5-mini', 'low', fallback='gpt-4.1-mini', timeout=90)
+}
+
+
+def _load_overrides(routes):
+    """Apply MODEL_ROUTES on top of the defaults"""
+    raw = os.environ.get('MODEL_ROUTES')
+    if not raw:
+        return routes
+    try:
+        overrides = json.loads(raw)
+    except ValueError as e:
+        print(f"Ignoring MODEL_ROUTES: {e}")
+        return routes
+    routes = dict(routes)
+    for call_site, fields in overrides.items():
+        base = routes[call_site].describe() if call_site in routes else {}
+        base.update(fields)
+        routes[call_site] = Route(**base)
+    return routes
+
+
+class ModelRouter:
+    """Picks the model for each call site and falls back when it fails"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def __contains__(self, call_site):
+        return call_site in self.routes
+
+    def call(self, call_site, attempt):
+        """
+        Run attempt(**model_kwargs) on the primary route, then once on the fallback if it raises
+        `attempt` receives model, timeout, max_retries and (for gpt-5) reasoning_effort.
+        A streamed attempt returns at its first delta, so its latency is time to first token.
+        DeadlineExceeded is raised as is, since the fallback would have no time either.
+        CircuitOpen still falls back: breakers are per model (modules/clients.py).
+        """
+        route = self.routes[call_site]
+        try:
+            return self._timed(call_site, route.model, attempt, route.primary_kwargs())
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not route.fallback:
+                raise
+            print(f"{call_site}: {route.model} failed ({e}), falling back to {route.fallback}")
+            ROUTE_FALLBACKS.inc(call_site=call_site)
+            return self._timed(call_site, route.fallback, attempt, route.fallback_kwargs())
+
+    def _timed(self, call_site, model, attempt, kwargs):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = attempt(**kwargs)
+            outcome = 'ok'
+            return result
+        finally:
+            ROUTE_LATENCY.observe(time.perf_counter() - start, call_site=call_site, model=model, outcome=outcome)
+            with self._lock:
+                counts = self.stats.setdefault(call_site, {}).setdefault(model, {'ok': 0, 'error': 0})
+                counts[outcome] += 1
+
+    def get_stats(self):
+        with self._lock:
+            calls = {site: {model: dict(counts) for model, counts in models.items()}
+                     for site, models in self.stats.items()}
+        return {
+            call_site: dict(route.describe(), calls=calls.get(call_site, {}))
+            for call_site, route in self.routes.items()
+        }
+
+
+# Global router instance
+router = ModelRouter(_load_overrides(ROUTES))
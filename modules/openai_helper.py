@@ -3,8 +3,55 @@ Helper module for OpenAI operations using direct requests
 This bypasses the httpx proxy issues entirely
 """
 import os
+import time
 import requests
 import json
+import itertools
+import contextvars
+from .async_runtime import call_upstream
+from .metrics import track_upstream, UPSTREAM_ERRORS, metrics, InstrumentedThreadPool
+from .clients import clients, get_session
+from .deadline import call_timeout, remaining, DeadlineExceeded
+from .circuit_breaker import CircuitOpen
+from .cache import TieredCache, cache_key
+from .rate_limiter import openai_limiter
+from .hedging import hedger
+from .tokens import count_tokens, record_usage
+from .model_router import router
+
+# Set LLM_CACHE=off to send every prompt to the API
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE', 'on') != 'off'
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 3600))
+# Seconds to keep responses per call site; 0 never caches (concepts should be fresh every brief)
+CACHE_TTLS = {
+    'BrandAnalyzer._ai_analyze': 7 * 24 * 3600,
+    'RedditMiner.mine_problems': 24 * 3600,
+    'RedditMiner._generate_structured_pain_points': 7 * 24 * 3600,
+    'CompetitorFinder._extract_competitors_from_search_results': 24 * 3600,
+    'AIEngine._analyze_trends': LLM_CACHE_TTL,
+    'AIEngine._find_opportunities': LLM_CACHE_TTL,
+    'AIEngine._generate_concepts': 0,
+    'AIEngine._generate_fused': 0
+}
+llm_cache = TieredCache('llm', max_entries=int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 1024)))
+
+# Rate-limited and transient server errors are retried with backoff
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 4))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Output allowance used to reserve tokens per call before the real usage is known
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get('OPENAI_EXPECTED_OUTPUT_TOKENS', 1500))
+
+# Threads used to fan prompts out (create_many()/map(), AIEngine's parallel steps); the rate limiter still applies
+fanout_pool = InstrumentedThreadPool('openai_fanout', max_workers=int(os.environ.get('OPENAI_FANOUT_WORKERS', 16)))
+
+OPENAI_RETRIES = metrics.counter(
+    'openai_retries_total', 'OpenAI calls retried after a rate limit or server error', ['status'])
+
+
+def estimate_tokens(data):
+    """Rough token count for a request: the prompt plus the output allowance"""
+    prompt_tokens = sum(count_tokens(str(message.get('content', ''))) for message in data['messages'])
+    return prompt_tokens + data.get('max_tokens', EXPECTED_OUTPUT_TOKENS)
 
 class OpenAIHelper:
     """Direct OpenAI API wrapper using requests library"""
@@ -29,11 +76,25 @@ class OpenAIHelper:
         """Compatibility layer to mimic OpenAI client structure"""
         return self
         
-    def create(self, messages, model=None, temperature=0.7, max_tokens=None, **kwargs):
+    def create(self, messages, model=None, temperature=0.7, max_tokens=None, call_site=None, cache=True,
+               stream=False, hedge=False, timeout=None, max_retries=None, **kwargs):
         """
         Create a chat completion using direct API call
         Mimics the OpenAI client.chat.completions.create() interface
+        `call_site` names the calling method for metrics and picks the cache TTL;
+        it is not sent to the API. `cache=False` bypasses the response cache.
+        With `stream=True`, returns an iterator of content deltas instead, once
+        the first delta has arrived (so a routed call can still fall back).
+        `hedge=True` sends a duplicate request when the call is slower than
+        usual for its call site and uses whichever answers first.
+        Without `model`, a routed call site gets its model, reasoning effort,
+        `timeout` and fallback from modules/model_router.py.
         """
+        if model is None and call_site in router:
+            return router.call(call_site, lambda **route: self.create(
+                messages, temperature=temperature, max_tokens=max_tokens, call_site=call_site, cache=cache,
+                stream=stream, hedge=hedge, **dict(kwargs, **route)))
+
         try:
             # Use provided model or default
             model = model or self.model
@@ -67,34 +128,209 @@ class OpenAIHelper:
             kwargs.pop('max_tokens', None)
             data.update(kwargs)
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=data,
-                timeout=60
-            )
+            if stream:
+                # Streamed output is consumed as it arrives, so it skips the cache
+                return self._stream(data, call_site or 'unknown', hedge, timeout, max_retries)
             
-            if response.status_code != 200:
-                error_msg = f"OpenAI API error: {response.status_code} - {response.text[:500]}"
-                print(f"Failed API call with data: {json.dumps(data, indent=2)}")
-                print(f"Error: {error_msg}")
-                raise Exception(error_msg)
+            # Identical requests (model, messages and every parameter) share a response
+            ttl = CACHE_TTLS.get(call_site, LLM_CACHE_TTL) if cache and LLM_CACHE_ENABLED else 0
+            key = cache_key(data) if ttl > 0 else None
+            call_site = call_site or 'unknown'
+            if key:
+                cached = llm_cache.get(key)
+                if cached is not None:
+                    record_usage(call_site, None)
+                    return OpenAIResponse(cached)
+            
+            if hedge:
+                result = hedger.run(call_site, lambda: self._complete(data, call_site, timeout, max_retries))
+            else:
+                result = self._complete(data, call_site, timeout, max_retries)
             
             # Return object that mimics OpenAI response structure
-            result = response.json()
+            if key:
+                llm_cache.set(key, result, ttl)
             return OpenAIResponse(result)
             
+        except (CircuitOpen, DeadlineExceeded):
+            # Raised unwrapped so the model router can tell them from API errors
+            raise
+        except requests.exceptions.Timeout:
+            raise Exception("OpenAI API request timed out")
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+    def _complete(self, data, call_site, timeout=None, max_retries=None):
+        """POST a non-streamed request and return the decoded response"""
+        response, estimate = self._post_with_backoff(data, call_site, timeout=timeout, max_retries=max_retries)
+        
+        if response.status_code != 200:
+            UPSTREAM_ERRORS.inc(upstream='openai', endpoint=call_site)
+            error_msg = f"OpenAI API error: {response.status_code} - {response.text[:500]}"
+            print(f"Failed API call with data: {json.dumps(data, indent=2)}")
+            print(f"Error: {error_msg}")
+            raise Exception(error_msg)
+        
+        result = response.json()
+        openai_limiter.settle(estimate, result.get('usage', {}).get('total_tokens'))
+        # Counted per copy, so a hedge's duplicate request shows up in the job's usage too
+        record_usage(call_site, result.get('usage') or {})
+        return result
+
+    def _stream(self, data, call_site, hedge=False, timeout=None, max_retries=None):
+        """
+        Iterator of content deltas, hedged on time to first token when asked
+        Returns once the first delta is in, so errors before it (a 5xx, a
+        timeout) are raised here rather than by the caller's loop. The losing
+        stream of a hedge is closed as soon as it starts, which stops generation.
+        """
+        if not hedge:
+            first, chunks = _first_chunk(self._stream_chunks(data, call_site, timeout, max_retries))
+            return itertools.chain(first, chunks)
+        first, chunks = hedger.run(
+            f'{call_site}:first_token',
+            lambda: _first_chunk(self._stream_chunks(data, call_site, timeout, max_retries)),
+            discard=lambda started: started[1].close()
+        )
+        return itertools.chain(first, chunks)
+
+    def _stream_chunks(self, data, call_site, timeout=None, max_retries=None):
+        """Yield the content deltas of a streamed (server-sent events) completion"""
+        data = dict(data, stream=True, stream_options={'include_usage': True})
+        try:
+            response, estimate = self._post_with_backoff(
+                data, call_site, stream=True, timeout=timeout, max_retries=max_retries)
+            if response.status_code != 200:
+                UPSTREAM_ERRORS.inc(upstream='openai', endpoint=call_site)
+                raise Exception(f"{response.status_code} - {response.text[:500]}")
+            
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == '[DONE]':
+                        break
+                    chunk = json.loads(payload)
+                    if chunk.get('usage'):
+                        openai_limiter.settle(estimate, chunk['usage'].get('total_tokens'))
+                        record_usage(call_site, chunk['usage'])
+                    for choice in chunk.get('choices', []):
+                        content = (choice.get('delta') or {}).get('content')
+                        if content:
+                            yield content
+                            
+        except (CircuitOpen, DeadlineExceeded):
+            raise
         except requests.exceptions.Timeout:
             raise Exception("OpenAI API request timed out")
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
 
+    def _post_with_backoff(self, data, call_site, stream=False, timeout=None, max_retries=None):
+        """
+        POST through the shared rate limiter, retrying 429s and 5xx errors
+        Waits for Retry-After / x-ratelimit-reset-* when the API sends them,
+        otherwise backs off exponentially with jitter. A 429 pauses every
+        caller, not just this one. Returns (response, estimated_tokens).
+        """
+        estimate = estimate_tokens(data)
+        max_retries = OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            openai_limiter.acquire(estimate)
+            request_timeout = call_timeout('openai', timeout or 60)
+            with track_upstream('openai', call_site):
+                response = get_session('openai').post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self.headers,
+                    json=data,
+                    timeout=request_timeout,
+                    stream=stream
+                )
+            openai_limiter.observe_headers(response.headers)
+            
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                break
+            if response.status_code == 429 and 'insufficient_quota' in response.text:
+                # Out of credit: waiting won't help
+                break
+            
+            # The request may not have been counted by the API; give back its tokens
+            openai_limiter.settle(estimate, 0)
+            delay = openai_limiter.backoff_delay(response.headers, attempt)
+            left = remaining()
+            if left is not None and delay >= left:
+                break
+            UPSTREAM_ERRORS.inc(upstream='openai', endpoint=call_site)
+            OPENAI_RETRIES.inc(status=str(response.status_code))
+            print(f"OpenAI {response.status_code} for {call_site}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            if response.status_code == 429:
+                openai_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+        return response, estimate
+
+    def get_completion(self, prompt, system=None, **kwargs):
+        """Single-prompt shortcut for create(); returns the reply text"""
+        return self.create(_prompt_messages(prompt, system), **kwargs).choices[0].message.content
+
+    def create_many(self, requests_kwargs, return_exceptions=False):
+        """
+        Run several create() calls concurrently and return the responses in order
+        Each item is the kwargs for one create() call. With `return_exceptions`,
+        a failed call puts its exception in the result list instead of raising.
+        """
+        # Each call runs in the caller's context so the job deadline still applies
+        futures = [
+            fanout_pool.submit(contextvars.copy_context().run, self.create, **kwargs)
+            for kwargs in requests_kwargs
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def map(self, prompts, system=None, return_exceptions=False, **kwargs):
+        """get_completion() for each prompt concurrently; returns the reply texts in order"""
+        responses = self.create_many(
+            [dict(kwargs, messages=_prompt_messages(prompt, system)) for prompt in prompts],
+            return_exceptions=return_exceptions
+        )
+        return [
+            response if isinstance(response, Exception) else response.choices[0].message.content
+            for response in responses
+        ]
+
+    async def acreate(self, messages, **kwargs):
+        """Async create() for the event-loop pipeline, bounded by the OpenAI concurrency limit"""
+        return await call_upstream('openai', self.create, messages, **kwargs)
+
+def _first_chunk(chunks):
+    """Wait for the first delta of a stream; returns ([first] or [], rest)"""
+    for chunk in chunks:
+        return [chunk], chunks
+    return [], chunks
+
+def _prompt_messages(prompt, system=None):
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+    return messages
+
 class OpenAIResponse:
     """Wrapper to mimic OpenAI SDK response structure"""
     
     def __init__(self, response_dict):
         self.response_dict = response_dict
         self.choices = [Choice(c) for c in response_dict.get('choices', [])]
+        # prompt_tokens / completion_tokens / total_tokens, as reported by the API
+        self.usage = response_dict.get('usage') or {}
+        self.model = response_dict.get('model')
 
 class Choice:
     """Wrapper for response choice"""
@@ -112,7 +348,7 @@ class Message:
 
 def get_openai_client():
     """
-    Get OpenAI helper instance
+    Get the shared OpenAI helper instance
     Returns OpenAIHelper instance that mimics OpenAI client interface
     """
-    return OpenAIHelper()
\ No newline at end of file
+    return clients.get(OpenAIHelper)
@@ -0,0 +1,190 @@
+"""
+Dependency-graph scheduler for the brief pipeline
+Each stage declares the context keys it reads and writes. Every stage whose
+inputs are available is started straight away, so independent branches
+(e.g. Reddit mining vs. competitor search) overlap instead of queueing.
+The same graph runs either on a thread pool (run) or on an event loop (run_async).
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .metrics import STAGE_LATENCY
+
+
+class StageFailed(Exception):
+    """Raised when a stage function throws; keeps the failing stage name"""
+
+    def __init__(self, stage, error):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    """A single step of the pipeline"""
+
+    def __init__(self, name, func, inputs=(), outputs=(), message=None, weight=1, async_func=None):
+        self.name = name
+        self.func = func
+        self.async_func = async_func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs) or (name,)
+        self.message = message or f"Running {name}..."
+        self.weight = weight
+
+    def run(self, context):
+        """Call the stage with its inputs and map the return value onto its outputs"""
+        with STAGE_LATENCY.time(stage=self.name):
+            return self._map_outputs(self.func(*[context[key] for key in self.inputs]))
+
+    async def run_async(self, context):
+        """Await the coroutine version of the stage, or push the sync one to a thread"""
+        args = [context[key] for key in self.inputs]
+        with STAGE_LATENCY.time(stage=self.name):
+            if self.async_func is not None:
+                return self._map_outputs(await self.async_func(*args))
+            return self._map_outputs(await asyncio.to_thread(self.func, *args))
+
+    def _map_outputs(self, result):
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        return dict(zip(self.outputs, result))
+
+
+class Pipeline:
+    """A set of stages executed as soon as their inputs are ready"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self._validate()
+
+    def _validate(self):
+        """Reject duplicate stage names and outputs written by more than one stage"""
+        names = set()
+        producers = {}
+        for stage in self.stages:
+            if stage.name in names:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            names.add(stage.name)
+            for key in stage.outputs:
+                if key in producers:
+                    raise ValueError(f"Output '{key}' produced by both {producers[key]} and {stage.name}")
+                producers[key] = stage.name
+
+    def run(self, context, executor=None, on_progress=None, on_stage_done=None):
+        """
+        Run every stage on a thread pool and return the final context
+        `on_progress(progress, message, stages)` is called whenever a stage starts
+        or finishes, with progress derived from the weights of completed stages.
+        `on_stage_done(stage, outputs)` is called with each stage's outputs (e.g.
+        to checkpoint them). Stages whose outputs are already in `context` are
+        skipped, which is how a failed run resumes.
+        """
+        state = _RunState(self.stages, context)
+        owns_executor = executor is None
+        if owns_executor:
+            executor = ThreadPoolExecutor(max_workers=max(len(self.stages), 1))
+
+        try:
+            while state.pending or state.running:
+                ready = state.start_ready()
+                for stage in ready:
+                    # Carry contextvars (e.g. the job deadline) into the stage thread
+                    future = executor.submit(contextvars.copy_context().run, stage.run, dict(state.context))
+                    state.running[future] = stage
+                if on_progress:
+                    on_progress(*state.progress())
+
+                done, _ = wait(state.running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = state.running.pop(future)
+                    outputs = state.finish(stage, future)
+                    if on_stage_done:
+                        on_stage_done(stage.name, outputs)
+            if on_progress:
+                on_progress(*state.progress())
+        finally:
+            if owns_executor:
+                executor.shutdown(wait=False)
+
+        return state.context
+
+    async def run_async(self, context, on_progress=None, on_stage_done=None):
+        """
+        Coroutine version of run(); stages run as tasks on the current loop
+        The callbacks may block (e.g. job store writes), so they run in a
+        worker thread and are awaited in order instead of stalling the loop.
+        """
+        state = _RunState(self.stages, context)
+        try:
+            while state.pending or state.running:
+                ready = state.start_ready()
+                for stage in ready:
+                    task = asyncio.ensure_future(stage.run_async(dict(state.context)))
+                    state.running[task] = stage
+                if on_progress:
+                    await asyncio.to_thread(on_progress, *state.progress())
+
+                done, _ = await asyncio.wait(state.running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = state.running.pop(task)
+                    outputs = state.finish(stage, task)
+                    if on_stage_done:
+                        await asyncio.to_thread(on_stage_done, stage.name, outputs)
+            if on_progress:
+                await asyncio.to_thread(on_progress, *state.progress())
+        finally:
+            for task in state.running:
+                task.cancel()
+
+        return state.context
+
+
+class _RunState:
+    """Bookkeeping shared by the thread and event-loop runners"""
+
+    def __init__(self, stages, context):
+        self.context = dict(context)
+        self.pending = []
+        self.running = {}
+        self.states = {}
+        self.total_weight = sum(stage.weight for stage in stages) or 1
+        self.done_weight = 0
+
+        for stage in stages:
+            if all(key in self.context for key in stage.outputs):
+                # Restored from a checkpoint
+                self.states[stage.name] = 'done'
+                self.done_weight += stage.weight
+            else:
+                self.states[stage.name] = 'pending'
+                self.pending.append(stage)
+
+    def start_ready(self):
+        """Mark every stage whose inputs exist as running and return them"""
+        ready = [stage for stage in self.pending if all(key in self.context for key in stage.inputs)]
+        for stage in ready:
+            self.pending.remove(stage)
+            self.states[stage.name] = 'running'
+        if not ready and not self.running:
+            missing = sorted({key for stage in self.pending for key in stage.inputs if key not in self.context})
+            raise ValueError(f"Stages {[s.name for s in self.pending]} wait on missing inputs: {missing}")
+        return ready
+
+    def finish(self, stage, future):
+        """Merge a finished stage's outputs and return them, or raise StageFailed"""
+        try:
+            outputs = future.result()
+        except Exception as e:
+            self.states[stage.name] = 'failed'
+            raise StageFailed(stage.name, e) from e
+        self.context.update(outputs)
+        self.states[stage.name] = 'done'
+        self.done_weight += stage.weight
+        return outputs
+
+    def progress(self):
+        """The (progress, message, stages) arguments for on_progress"""
+        active = [stage.message for stage in self.running.values()]
+        message = ' | '.join(active) if active else 'Finishing up...'
+        return int(self.done_weight * 100 / self.total_weight), message, dict(self.states)
@@ -0,0 +1,213 @@
+"""
+Client-side rate limiting for OpenAI
+Requests-per-minute and tokens-per-minute token buckets shared by every
+caller in the process. Callers queue in arrival order, so under load calls go
+out at the account's limit instead of all firing at once and turning into 429s.
+When a 429 does come back, the whole limiter pauses for the time the API asks
+(Retry-After / x-ratelimit-reset-*), and the caller retries with
+exponential backoff and jitter.
+"""
+import os
+import re
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from .deadline import remaining, DeadlineExceeded
+from .metrics import metrics
+
+# Per-process limits; with several workers, divide the account limits between them (0 disables)
+OPENAI_RPM = int(os.environ.get('OPENAI_RPM', 500))
+OPENAI_TPM = int(os.environ.get('OPENAI_TPM', 200000))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+RATE_LIMIT_WAIT = metrics.histogram(
+    'rate_limiter_wait_seconds', 'Time calls spent queued in the client-side rate limiter', ['limiter'],
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+class TokenBucket:
+    """Refills continuously up to `per_minute`; callers take amounts out of it"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        rate = self.capacity / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 if it is now)"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) * 60.0 / self.capacity
+
+
+class RateLimiter:
+    """FIFO-fair RPM + TPM limiter with a shared pause for server-side backoff"""
+
+    def __init__(self, name, rpm, tpm):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.paused_until = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self.stats = {'acquired': 0, 'waited': 0, 'pauses': 0}
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def _wait_time(self, tokens, now):
+        waits = [self.paused_until - now]
+        for bucket in self._buckets():
+            bucket.refill(now)
+        if self.requests:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def acquire(self, tokens=0):
+        """
+        Block until one request and `tokens` tokens are available, in arrival order
+        Raises DeadlineExceeded if the job's deadline would pass while queued.
+        """
+        start = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(tokens, now) if self._queue[0] is ticket else None
+                    if wait is not None and wait <= 0:
+                        if self.requests:
+                            self.requests.level -= 1
+                        if self.tokens:
+                            self.tokens.level -= min(tokens, self.tokens.capacity)
+                        break
+                    left = remaining()
+                    if left is not None and (wait or 0) >= left:
+                        raise DeadlineExceeded(f"{self.name} rate limit wait exceeds the job deadline")
+                    # Non-head waiters sleep until the head leaves the queue (or the deadline)
+                    timeouts = [t for t in (wait, left) if t is not None]
+                    self._cond.wait(min(timeouts) if timeouts else None)
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self.stats['acquired'] += 1
+            if waited > 0.01:
+                self.stats['waited'] += 1
+        RATE_LIMIT_WAIT.observe(waited, limiter=self.name)
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once the real usage of a call is known"""
+        if self.tokens and actual is not None:
+            with self._cond:
+                self.tokens.level -= actual - estimated
+                self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Hold every caller for `seconds` (server asked us to back off)"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.stats['pauses'] += 1
+            self._cond.notify_all()
+
+    def observe_headers(self, headers):
+        """Sync the buckets with the x-ratelimit-remaining-* values the API reports"""
+        with self._cond:
+            now = time.monotonic()
+            for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+                left = _int_header(headers, f'x-ratelimit-remaining-{kind}')
+                if bucket is None or left is None:
+                    continue
+                bucket.refill(now)
+                bucket.level = min(bucket.level, left)
+                if left <= 0:
+                    reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                    if reset:
+                        self.paused_until = max(self.paused_until, now + reset)
+
+    def backoff_delay(self, headers, attempt):
+        """
+        How long to wait before retry number `attempt` (0-based)
+        Uses Retry-After / x-ratelimit-reset-* when present, otherwise
+        exponential backoff with full jitter.
+        """
+        hinted = retry_after(headers)
+        if hinted is not None:
+            # A little jitter so the queued callers don't all come back at once
+            return hinted + random.uniform(0, 0.5)
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    def get_stats(self):
+        with self._cond:
+            now = time.monotonic()
+            for bucket in self._buckets():
+                bucket.refill(now)
+            return dict(
+                self.stats,
+                queued=len(self._queue),
+                paused_for=round(max(self.paused_until - now, 0), 2),
+                rpm=self.requests.capacity if self.requests else None,
+                tpm=self.tokens.capacity if self.tokens else None,
+                requests_available=int(self.requests.level) if self.requests else None,
+                tokens_available=int(self.tokens.level) if self.tokens else None
+            )
+
+
+def _int_header(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_duration(value):
+    """Parse OpenAI reset durations like '1s', '6m0s', '250ms' into seconds"""
+    if not value:
+        return None
+    units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    parts = re.findall(r'([\d.]+)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def retry_after(headers):
+    """Seconds the server asked us to wait, from Retry-After or the rate-limit reset headers"""
+    millis = headers.get('retry-after-ms')
+    if millis:
+        try:
+            return float(millis) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value:
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+    resets = [parse_duration(headers.get(f'x-ratelimit-reset-{kind}')) for kind in ('requests', 'tokens')]
+    resets = [reset for reset in resets if reset]
+    return max(resets) if resets else None
+
+
+# Global limiter shared by every OpenAI caller in this process
+openai_limiter = RateLimiter('openai', OPENAI_RPM, OPENAI_TPM)
+
+metrics.gauge('rate_limiter_queue_depth', 'Calls waiting in the client-side rate limiter', ['limiter'],
+              callback=lambda: [({'limiter': 'openai'}, openai_limiter.get_stats()['queued'])])
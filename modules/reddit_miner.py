@@ -1,13 +1,20 @@
 import os
-import json
-from modules.openai_helper import OpenAIHelper
+from modules.openai_helper import get_openai_client
+from modules.async_runtime import call_upstream
+from modules.schemas import response_format, parse_response
 
 class RedditMiner:
     def __init__(self):
-        self.ai = OpenAIHelper()
+        self.ai = get_openai_client()
+
+    def mine_problems(self, keywords, niche, shared=None):
+        """
+        Generate Reddit-style pain points using AI instead of scraping
+        With a SharedWork `shared`, each niche is only mined once per batch.
+        """
+        if shared is not None:
+            return shared.get_or_compute(self._niche_key(keywords, niche), self.mine_problems, keywords, niche)
 
-    def mine_problems(self, keywords, niche):
-        """Generate Reddit-style pain points using AI instead of scraping"""
         try:
             print(f"Reddit: Generating pain points for niche: {niche}")
 
@@ -28,25 +35,21 @@ class RedditMiner:
 
             Format as JSON array only, no markdown."""
 
-            response = self.ai.get_completion(prompt, temperature=0.9)
+            response = self.ai.get_completion(
+                prompt, temperature=0.9, call_site='RedditMiner.mine_problems',
+                response_format=response_format('pain_points')
+            )
 
             # Try to parse the response as JSON
             try:
-                # Clean up the response if needed
-                response = response.strip()
-                if response.startswith('```'):
-                    response = response.split('```')[1]
-                    if response.startswith('json'):
-                        response = response[4:]
-
-                pain_points = json.loads(response)
+                pain_points = parse_response('pain_points', response)
 
                 # Ensure we have the right structure
-                if isinstance(pain_points, list) and len(pain_points) > 0:
+                if len(pain_points) > 0:
                     print(f"Reddit: Generated {len(pain_points)} pain point categories")
                     return pain_points[:5]  # Return top 5
 
-            except json.JSONDecodeError:
+            except ValueError:
                 print("Reddit: Failed to parse AI response, using fallback")
                 pass
 
@@ -57,6 +60,21 @@ class RedditMiner:
             print(f"Reddit pain point generation error: {e}")
             return self._get_fallback_pain_points(niche, keywords)
 
+    async def mine_problems_async(self, keywords, niche, shared=None):
+        """Async mine_problems() bounded by the OpenAI concurrency limit"""
+        if shared is not None:
+            return await shared.get_or_compute_async(
+                self._niche_key(keywords, niche), self.mine_problems_async, keywords, niche
+            )
+        return await call_upstream('openai', self.mine_problems, keywords, niche)
+
+    def _niche_key(self, keywords, niche):
+        """SharedWork key for a niche's pain points (keywords only matter when the niche is unknown)"""
+        niche = (niche or '').strip().lower()
+        if niche in ('', 'unknown'):
+            return ('reddit_keywords', tuple(k.strip().lower() for k in keywords[:3]))
+        return ('reddit_niche', niche)
+
     def _generate_structured_pain_points(self, niche, keywords):
         """Generate pain points with a more structured approach"""
         main_topic = keywords[0] if keywords else niche
@@ -71,16 +89,25 @@ class RedditMiner:
 
         pain_points = []
 
-        for category, focus in categories:
-            prompt = f"""Generate a Reddit-style pain point for {niche} focusing on {focus}.
+        prompts = [
+            f"""Generate a Reddit-style pain point for {niche} focusing on {focus}.
             Include:
             1. A frustrated user quote (one sentence)
             2. Three specific complaints users would have
 
             Keep it realistic and specific to {main_topic}."""
+            for category, focus in categories
+        ]
+        # All five categories are requested at once; failures come back as exceptions
+        responses = self.ai.map(
+            prompts, temperature=0.8, max_tokens=200, return_exceptions=True,
+            call_site='RedditMiner._generate_structured_pain_points'
+        )
 
+        for (category, focus), response in zip(categories, responses):
             try:
-                response = self.ai.get_completion(prompt, temperature=0.8, max_tokens=200)
+                if isinstance(response, Exception):
+                    raise response
 
                 # Parse the response and structure it
                 lines = response.strip().split('\n')
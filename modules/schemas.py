@@ -0,0 +1,341 @@
+"""
+JSON schemas for every structured LLM payload
+Each call site asks for `response_format(name)`, a strict json_schema the API
+enforces while decoding, and reads the reply with `parse_response(name, text)`.
+The parser is deliberately tolerant: it strips fences and preamble, repairs
+near-valid JSON (trailing commas, smart quotes, Python literals, output cut off
+mid-object) and coerces the result to the schema, so a slightly malformed
+reply is still used instead of throwing the whole call away. What can't be
+repaired is dropped rather than padded: list items missing their key fields,
+and replies with no content at all (an empty list, or an object whose
+fields are all empty), which fail so callers use their fallbacks.
+Strict mode only accepts an object at the top level, so list payloads are
+wrapped in an object under `wrap` and unwrapped again by the parser.
+"""
+import re
+import json
+from .metrics import metrics
+
+PARSE_RESULTS = metrics.counter(
+    'llm_output_parse_total', 'Structured LLM replies by schema and outcome (clean/repaired/failed)',
+    ['schema', 'result'])
+
+FUNNEL_TYPES = ['direct_purchase', 'lead_magnet', 'quiz', 'vsl', 'free_trial', 'demo_request', 'other']
+
+
+def _string_list():
+    return {'type': 'array', 'items': {'type': 'string'}}
+
+
+def _object(**properties):
+    """Strict-mode object: every property required, nothing else allowed"""
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False
+    }
+
+
+def _item(key_fields, **properties):
+    """List item object; the parser drops items whose `key_fields` are missing or empty"""
+    return dict(_object(**properties), **{KEY_FIELDS: list(key_fields)})
+
+
+# Parser-only annotation, stripped from what is sent to the API
+KEY_FIELDS = 'x-key-fields'
+
+
+SCHEMAS = {
+    'brand_analysis': {
+        'schema': _object(
+            industry={'type': 'string'},
+            niche={'type': 'string'},
+            usp=_string_list(),
+            funnel_type={'type': 'string', 'enum': FUNNEL_TYPES},
+            keywords=_string_list()
+        )
+    },
+    'competitors': {
+        'wrap': 'competitors',
+        'schema': {'type': 'array', 'items': _item(
+            ['brand_name'],
+            brand_name={'type': 'string'},
+            url={'type': 'string'},
+            usp={'type': 'string'},
+            why_competitor={'type': 'string'}
+        )}
+    },
+    'creative_trends': {
+        'schema': _object(
+            headline_patterns=_string_list(),
+            visual_themes=_string_list(),
+            cta_styles=_string_list(),
+            hook_types=_string_list()
+        )
+    },
+    'opportunities': {
+        'wrap': 'opportunities',
+        'schema': {'type': 'array', 'items': _item(
+            ['title'],
+            type={'type': 'string', 'enum': ['angle', 'design', 'funnel']},
+            title={'type': 'string'},
+            description={'type': 'string'},
+            implementation={'type': 'string'}
+        )}
+    },
+    'ad_concepts': {
+        'wrap': 'concepts',
+        'schema': {'type': 'array', 'items': _item(
+            ['headline', 'body_copy'],
+            hook_type={'type': 'string'},
+            headline={'type': 'string'},
+            body_copy={'type': 'string'},
+            cta={'type': 'string'},
+            visual_direction={'type': 'string'},
+            rationale={'type': 'string'},
+            pain_point_addressed={'type': 'string'}
+        )}
+    },
+    'pain_points': {
+        'wrap': 'pain_points',
+        'schema': {'type': 'array', 'items': _item(
+            ['category'],
+            category={'type': 'string'},
+            count={'type': 'integer'},
+            example_quote={'type': 'string'},
+            problems={'type': 'array', 'items': _item(
+                ['statement'],
+                statement={'type': 'string'},
+                score={'type': 'integer'}
+            )}
+        )}
+    }
+}
+
+# Trends, opportunities and concepts in one reply (AIEngine's fused mode)
+SCHEMAS['fused_brief'] = {
+    'schema': _object(
+        creative_trends=SCHEMAS['creative_trends']['schema'],
+        opportunities=SCHEMAS['opportunities']['schema'],
+        concepts=SCHEMAS['ad_concepts']['schema']
+    )
+}
+
+
+def response_format(name):
+    """`response_format` argument for a strict json_schema reply"""
+    entry = SCHEMAS[name]
+    schema = entry['schema']
+    if entry.get('wrap'):
+        schema = _object(**{entry['wrap']: schema})
+    return {
+        'type': 'json_schema',
+        'json_schema': {'name': name, 'strict': True, 'schema': _api_schema(schema)}
+    }
+
+
+def _api_schema(schema):
+    """`schema` without the parser-only annotations"""
+    if isinstance(schema, dict):
+        return {key: _api_schema(value) for key, value in schema.items() if key != KEY_FIELDS}
+    if isinstance(schema, list):
+        return [_api_schema(value) for value in schema]
+    return schema
+
+
+def parse_response(name, text):
+    """
+    Extract, repair and validate a reply against schema `name`
+    Returns the payload (unwrapped for list schemas). Raises ValueError only
+    when nothing usable can be recovered, including an object with every field empty.
+    """
+    entry = SCHEMAS[name]
+    try:
+        value, repaired = extract_json(text)
+        if entry.get('wrap') and isinstance(value, dict) and entry['wrap'] in value:
+            value = value[entry['wrap']]
+        value = coerce(value, entry['schema'])
+        if not _has_content(value, entry['schema']):
+            raise ValueError('Reply has no content')
+    except ValueError:
+        PARSE_RESULTS.inc(schema=name, result='failed')
+        raise
+    PARSE_RESULTS.inc(schema=name, result='repaired' if repaired else 'clean')
+    return value
+
+
+def parse_item(name, item):
+    """One element of list schema `name` (e.g. from a stream), coerced; None if unusable"""
+    try:
+        return coerce(item, SCHEMAS[name]['schema']['items'])
+    except ValueError:
+        return None
+
+
+def extract_json(text):
+    """Return (value, repaired) for the first JSON object/array in `text`"""
+    if not isinstance(text, str):
+        raise ValueError('No text to parse')
+    fenced = re.search(r'```(?:json)?\s*(.*?)(?:```|$)', text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        raise ValueError('No JSON object or array in response')
+    text = text[min(starts):]
+
+    try:
+        return json.JSONDecoder().raw_decode(text)[0], False
+    except ValueError:
+        pass
+    return _repair(text), True
+
+
+def _repair(text):
+    """Best-effort fix for common near-JSON mistakes, including truncated output"""
+    text = (text.replace('“', '"').replace('”', '"')
+                .replace('‘', "'").replace('’', "'"))
+    text = re.sub(r'\bTrue\b', 'true', text)
+    text = re.sub(r'\bFalse\b', 'false', text)
+    text = re.sub(r'\bNone\b', 'null', text)
+    text = re.sub(r',\s*([}\]])', r'\1', text)
+
+    # Try the whole text, then shorter prefixes cut at element boundaries,
+    # closing whatever strings/brackets are still open
+    cuts = [len(text)] + _comma_positions(text)[::-1][:20]
+    for cut in cuts:
+        candidate = _close(text[:cut])
+        try:
+            return json.JSONDecoder().raw_decode(candidate)[0]
+        except ValueError:
+            continue
+    raise ValueError('Response is not repairable JSON')
+
+
+def _scan(text):
+    """Return (in_string, open_brackets, comma_positions) for `text`"""
+    in_string = escaped = False
+    stack = []
+    commas = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '[{':
+            stack.append(char)
+        elif char in ']}':
+            if stack:
+                stack.pop()
+        elif char == ',':
+            commas.append(i)
+    return in_string, stack, commas
+
+
+def _comma_positions(text):
+    return _scan(text)[2]
+
+
+def _close(text):
+    in_string, stack, _ = _scan(text)
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(',')
+    if text.endswith(':'):
+        # Dangling key: drop it
+        text = text[:text.rfind(',')] if ',' in text else text
+    closers = {'[': ']', '{': '}'}
+    return text + ''.join(closers[bracket] for bracket in reversed(stack))
+
+
+_DEFAULTS = {'string': '', 'integer': 0, 'number': 0, 'array': [], 'boolean': False}
+
+
+def coerce(value, schema):
+    """Make `value` fit `schema`: fill missing fields, fix scalar types, drop unusable items"""
+    kind = schema.get('type')
+    if kind == 'object':
+        if not isinstance(value, dict):
+            raise ValueError(f'Expected an object, got {type(value).__name__}')
+        result = dict(value)
+        for key, prop in schema['properties'].items():
+            if key in value:
+                try:
+                    result[key] = coerce(value[key], prop)
+                    continue
+                except ValueError:
+                    pass
+            result[key] = _default(prop)
+        missing = [key for key in schema.get(KEY_FIELDS, ()) if not result[key]]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        return result
+
+    if kind == 'array':
+        if isinstance(value, dict):
+            lists = [item for item in value.values() if isinstance(item, list)]
+            # {"anything": [...]} wrapper, or a single item sent without its list
+            value = lists[0] if len(lists) == 1 else [value]
+        elif not isinstance(value, list):
+            value = [value] if value not in (None, '') else []
+        items = []
+        for item in value:
+            try:
+                items.append(coerce(item, schema['items']))
+            except ValueError:
+                continue
+        if value and not items:
+            raise ValueError('No usable items in array')
+        return items
+
+    if kind == 'string':
+        if isinstance(value, list):
+            value = ', '.join(str(item) for item in value)
+        elif value is None:
+            value = ''
+        elif not isinstance(value, str):
+            value = str(value)
+        if 'enum' in schema and value not in schema['enum']:
+            normalized = re.sub(r'[\s-]+', '_', value.strip().lower())
+            value = normalized if normalized in schema['enum'] else schema['enum'][-1]
+        return value
+
+    if kind in ('integer', 'number'):
+        if isinstance(value, bool):
+            raise ValueError('Expected a number')
+        if isinstance(value, str):
+            match = re.search(r'-?\d+(?:\.\d+)?', value)
+            if not match:
+                raise ValueError(f'Expected a number, got {value!r}')
+            value = float(match.group())
+        if not isinstance(value, (int, float)):
+            raise ValueError(f'Expected a number, got {type(value).__name__}')
+        return int(value) if kind == 'integer' else value
+
+    return value
+
+
+def _has_content(value, schema):
+    """
+    Whether a coerced value holds anything from the model
+    Enum fields don't count: a missing one is filled with the enum's catch-all
+    value, so it can't tell an empty reply from a real one.
+    """
+    if schema.get('type') == 'object':
+        return any(_has_content(value[key], prop) for key, prop in schema['properties'].items()
+                   if 'enum' not in prop)
+    return bool(value)
+
+
+def _default(schema):
+    if schema.get('type') == 'object':
+        return {key: _default(prop) for key, prop in schema['properties'].items()}
+    if 'enum' in schema:
+        return schema['enum'][-1]
+    return _DEFAULTS.get(schema.get('type'))
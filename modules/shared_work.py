@@ -0,0 +1,60 @@
+"""
+Compute-once memo for work shared between the jobs of a batch
+Jobs for different brands in the same niche ask for the same Reddit pain points
+and overlapping Foreplay keyword searches; the first job to ask computes the
+result and every other job waits for it instead of repeating the call.
+"""
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from .metrics import CACHE_REQUESTS
+
+
+class SharedWork:
+    """Keyed results computed once and shared by every caller"""
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _claim(self, key):
+        """Return (future, owner); the owner is responsible for filling the future"""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache='shared_work', result='hit')
+                return future, False
+            future = Future()
+            self._futures[key] = future
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache='shared_work', result='miss')
+            return future, True
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        """Return the result for `key`, calling func(*args, **kwargs) only the first time"""
+        future, owner = self._claim(key)
+        if owner:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        # Each job gets its own copy so nobody mutates another job's data
+        return copy.deepcopy(future.result())
+
+    async def get_or_compute_async(self, key, coro_func, *args, **kwargs):
+        """Async get_or_compute(); `coro_func` is awaited by the first caller only"""
+        future, owner = self._claim(key)
+        if owner:
+            try:
+                future.set_result(await coro_func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        return copy.deepcopy(await asyncio.wrap_future(future))
+
+    def get_stats(self):
+        with self._lock:
+            return {'keys': len(self._futures), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,85 @@
+"""
+Memoized AIEngine stages
+Each AI step (trends, opportunities, concepts, fused brief) stores its
+parsed output under a hash of its actual inputs: the prompt after budget
+trimming, plus the model route. Re-running a brief for a brand whose inputs
+haven't changed reuses those outputs, so only steps with new inputs call the
+LLM. Only successful outputs are stored; fallbacks are never memoized.
+Hits and misses for the current job are collected in a memo_scope().
+"""
+import os
+import copy
+import threading
+import contextvars
+from contextlib import contextmanager
+from .cache import TieredCache, cache_key
+from .model_router import router
+
+# Seconds to keep stage outputs (0 disables memoization)
+AI_STAGE_MEMO_TTL = int(os.environ.get('AI_STAGE_MEMO_TTL', 14 * 24 * 3600))
+
+_job_report = contextvars.ContextVar('stage_memo_report', default=None)
+
+
+class MemoReport:
+    """Per-stage hit/miss counts for one job"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, hit):
+        with self._lock:
+            counts = self.stages.setdefault(stage, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+    def summary(self):
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self.stages.items()}
+        return {
+            'hits': sum(counts['hits'] for counts in stages.values()),
+            'misses': sum(counts['misses'] for counts in stages.values()),
+            'stages': stages
+        }
+
+
+@contextmanager
+def memo_scope(report=None):
+    """Collect stage memo hits and misses for every AI step run inside the block"""
+    report = report or MemoReport()
+    token = _job_report.set(report)
+    try:
+        yield report
+    finally:
+        _job_report.reset(token)
+
+
+class StageMemo:
+    """Stage outputs in a TieredCache, keyed on the stage's inputs"""
+
+    def __init__(self, cache, ttl=AI_STAGE_MEMO_TTL):
+        self.cache = cache
+        self.ttl = ttl
+
+    def key(self, stage, *inputs):
+        """Hash of the stage name, its model route and its inputs"""
+        route = router.routes[stage].describe() if stage in router else None
+        return cache_key(stage, route, *inputs)
+
+    def get(self, stage, key):
+        """Return the stored output, or None; counts a hit or miss for the current job"""
+        if self.ttl <= 0:
+            return None
+        value = self.cache.get(key)
+        report = _job_report.get()
+        if report is not None:
+            report.record(stage, value is not None)
+        # Callers may modify what they get back; keep the memory tier's copy intact
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        if self.ttl > 0:
+            self.cache.set(key, copy.deepcopy(value), self.ttl)
+
+
+stage_memo = StageMemo(TieredCache('ai_stage', max_entries=int(os.environ.get('AI_STAGE_MEMO_MAX_ENTRIES', 512))))
@@ -0,0 +1,159 @@
+"""
+Token accounting and prompt budgets
+Every OpenAI response's `usage` is counted per call site (llm_tokens_total)
+and, inside a usage_scope(), per job. Prompts with variable-size inputs
+(website text, search results, ads) are built with fit_prompt(), which trims
+their sections lowest priority first until the prompt fits the call site's
+input-token budget, so per-call latency and cost stay predictable.
+"""
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from .metrics import metrics
+
+# Input-token targets per call site (user prompt only); unlisted call sites are not trimmed
+PROMPT_BUDGETS = {
+    'BrandAnalyzer._ai_analyze': 800,
+    'CompetitorFinder._extract_competitors_from_search_results': 1200,
+    'AIEngine._analyze_trends': 800,
+    'AIEngine._generate_fused': 1800
+}
+# Multiplies every budget: 0.5 halves prompts, 2 doubles them
+PROMPT_BUDGET_SCALE = float(os.environ.get('PROMPT_BUDGET_SCALE', 1.0))
+
+LLM_TOKENS = metrics.counter(
+    'llm_tokens_total', 'Tokens used by OpenAI calls by call site and kind (prompt/completion)',
+    ['call_site', 'kind'])
+PROMPT_TRIMS = metrics.counter(
+    'prompt_trims_total', 'Prompts trimmed to fit their token budget, by call site and section',
+    ['call_site', 'section'])
+
+_job_usage = contextvars.ContextVar('job_usage', default=None)
+
+
+def count_tokens(text):
+    """Rough token count: ~4 characters per token"""
+    return len(text) // 4
+
+
+class TokenUsage:
+    """Token totals for one job, broken down by call site"""
+
+    def __init__(self):
+        self.by_call_site = {}
+        self._lock = threading.Lock()
+
+    def add(self, call_site, usage=None):
+        """Count one call; `usage` is None for responses served from the cache"""
+        with self._lock:
+            site = self.by_call_site.setdefault(
+                call_site, {'calls': 0, 'cached_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            site['calls'] += 1
+            if usage is None:
+                site['cached_calls'] += 1
+                return
+            site['prompt_tokens'] += usage.get('prompt_tokens') or 0
+            site['completion_tokens'] += usage.get('completion_tokens') or 0
+
+    def summary(self):
+        with self._lock:
+            by_call_site = {name: dict(site) for name, site in self.by_call_site.items()}
+        prompt = sum(site['prompt_tokens'] for site in by_call_site.values())
+        completion = sum(site['completion_tokens'] for site in by_call_site.values())
+        return {
+            'prompt_tokens': prompt,
+            'completion_tokens': completion,
+            'total_tokens': prompt + completion,
+            'calls': sum(site['calls'] for site in by_call_site.values()),
+            'by_call_site': by_call_site
+        }
+
+
+@contextmanager
+def usage_scope(usage=None):
+    """Collect the token usage of every OpenAI call made inside the block (and its stage threads)"""
+    usage = usage or TokenUsage()
+    token = _job_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _job_usage.reset(token)
+
+
+def record_usage(call_site, usage):
+    """Count a response's usage for the call site and the current job"""
+    if usage is not None:
+        LLM_TOKENS.inc(usage.get('prompt_tokens') or 0, call_site=call_site, kind='prompt')
+        LLM_TOKENS.inc(usage.get('completion_tokens') or 0, call_site=call_site, kind='completion')
+    job_usage = _job_usage.get()
+    if job_usage is not None:
+        job_usage.add(call_site, usage)
+
+
+class Section:
+    """
+    Variable-size part of a prompt that the governor may shrink
+    Text is cut from the end down to `minimum` characters; a list loses items
+    from the end down to `minimum` items and is turned into text by `render`.
+    Lower `priority` sections are trimmed first.
+    """
+
+    def __init__(self, value, priority=0, minimum=0, render=None):
+        self.value = value
+        self.priority = priority
+        self.minimum = minimum
+        self.render = render or str
+        self.trimmed = False
+
+    def text(self):
+        return self.value if isinstance(self.value, str) else self.render(self.value)
+
+    def shrink(self, excess_tokens):
+        """Make the section smaller by about `excess_tokens`; False once it can't shrink"""
+        if isinstance(self.value, str):
+            keep = max(len(self.value) - max(excess_tokens, 1) * 4, self.minimum)
+            if keep >= len(self.value):
+                return False
+            cut = self.value[:keep]
+            # Prefer ending on a word boundary
+            self.value = cut.rsplit(' ', 1)[0] if ' ' in cut[keep // 2:] else cut
+        else:
+            if len(self.value) <= self.minimum:
+                return False
+            self.value = self.value[:-1]
+        self.trimmed = True
+        return True
+
+
+def prompt_budget(call_site):
+    budget = PROMPT_BUDGETS.get(call_site)
+    return int(budget * PROMPT_BUDGET_SCALE) if budget else None
+
+
+def fit_prompt(call_site, template, **fields):
+    """
+    Fill `template` (str.format style) and trim its Section fields to the call site's budget
+    Plain fields are inserted as they are and never trimmed.
+    """
+    sections = sorted(
+        ((name, value) for name, value in fields.items() if isinstance(value, Section)),
+        key=lambda item: item[1].priority
+    )
+
+    def render():
+        return template.format(**{
+            name: value.text() if isinstance(value, Section) else value
+            for name, value in fields.items()
+        })
+
+    prompt = render()
+    budget = prompt_budget(call_site)
+    if budget is None:
+        return prompt
+    for name, section in sections:
+        while count_tokens(prompt) > budget and section.shrink(count_tokens(prompt) - budget):
+            prompt = render()
+        if section.trimmed:
+            PROMPT_TRIMS.inc(call_site=call_site, section=name)
+    return prompt
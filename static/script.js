@@ -1,5 +1,6 @@
 let currentJobId = null;
 let pollInterval = null;
+let eventSource = null;
 
 function generateBrief() {
     const url = document.getElementById('brand-url').value.trim();
@@ -23,13 +24,16 @@ function generateBrief() {
     
     // Reset progress
     updateProgress(0, 'Initializing...');
+    updateConcepts([]);
     
-    // Send request to backend
+    // Send request to backend; the idempotency key makes a retried submit join the same job
+    const headers = { 'Content-Type': 'application/json' };
+    if (window.crypto && crypto.randomUUID) {
+        headers['Idempotency-Key'] = crypto.randomUUID();
+    }
     fetch('/api/generate', {
         method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
+        headers: headers,
         body: JSON.stringify({ url: url })
     })
     .then(response => {
@@ -40,7 +44,7 @@ function generateBrief() {
     })
     .then(data => {
         currentJobId = data.job_id;
-        startPolling();
+        startTracking();
     })
     .catch(error => {
         console.error('Error:', error);
@@ -48,6 +52,58 @@ function generateBrief() {
     });
 }
 
+function startTracking() {
+    // Prefer the server push stream; fall back to polling where it isn't available
+    if (window.EventSource) {
+        startStream();
+    } else {
+        startPolling();
+    }
+}
+
+function startStream() {
+    eventSource = new EventSource(`/api/status/${currentJobId}/stream`);
+    
+    eventSource.addEventListener('progress', function(e) {
+        const data = JSON.parse(e.data);
+        updateProgress(data.progress, data.message);
+        updateConcepts(data.partial_concepts);
+    });
+    
+    eventSource.addEventListener('completed', function(e) {
+        const data = JSON.parse(e.data);
+        stopTracking();
+        updateProgress(data.progress, data.message);
+        showResult(data.result);
+    });
+    
+    eventSource.addEventListener('failed', function(e) {
+        const data = JSON.parse(e.data);
+        stopTracking();
+        showError(data.error || 'Brief generation failed');
+    });
+    
+    eventSource.onerror = function() {
+        // Stream dropped (proxy, network, server restart) - switch to polling
+        stopStream();
+        if (currentJobId) {
+            startPolling();
+        }
+    };
+}
+
+function stopStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+function stopTracking() {
+    stopStream();
+    stopPolling();
+}
+
 function startPolling() {
     // Poll every 2 seconds
     pollInterval = setInterval(checkStatus, 2000);
@@ -62,6 +118,7 @@ function checkStatus() {
     .then(response => response.json())
     .then(data => {
         updateProgress(data.progress, data.message);
+        updateConcepts(data.partial_concepts);
         
         if (data.status === 'completed') {
             stopPolling();
@@ -89,6 +146,17 @@ function updateProgress(percentage, message) {
     document.getElementById('status-text').textContent = message;
 }
 
+function updateConcepts(concepts) {
+    // Headlines of the ad concepts generated so far (they stream in one by one)
+    const list = document.getElementById('concept-preview');
+    list.innerHTML = '';
+    (concepts || []).forEach(concept => {
+        const item = document.createElement('li');
+        item.textContent = concept.headline || 'Untitled concept';
+        list.appendChild(item);
+    });
+}
+
 function showResult(result) {
     document.getElementById('coda-link').href = result.coda_url;
     showSection('result-section');
@@ -120,9 +188,9 @@ function resetForm() {
     document.getElementById('brand-url').value = '';
     document.getElementById('generate-btn').disabled = false;
     
-    // Stop any ongoing polling
-    stopPolling();
+    // Stop any ongoing status tracking
     currentJobId = null;
+    stopTracking();
     
     // Show input section
     showSection('input-section');